@@ -1,8 +1,12 @@
+import os
 from pathlib import Path
 
 
 class Config:
     BASE_DIR = Path(__file__).parents[1]
     DATA_DIR = BASE_DIR / "data"
-    URL_BASE = "https://books.toscrape.com/"
+    # sobrescrevível para apontar o scraper para um servidor local (ex.: testes)
+    URL_BASE = os.getenv("SCRAPING_URL_BASE", "https://books.toscrape.com/")
     CSV_FILE = DATA_DIR / "books_data.csv"
+    # logs da API (texto em api_logs.log, requisições estruturadas em requests/)
+    LOG_DIR = Path(os.getenv("LOG_DIR", BASE_DIR.parents[1] / "logs"))
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import hashlib
+import os
+from typing import Any, Callable, Dict
+
+from fastapi import Depends, HTTPException, Request, Response
+
+from tc_01.core.security import auth_required
+
+# ===== Config =====
+# Por quanto tempo (s) o cliente pode reusar a resposta sem revalidar
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "60"))       # listagens e buscas
+AGGREGATE_MAX_AGE = int(os.getenv("AGGREGATE_MAX_AGE", "300"))  # livro, categorias e estatísticas
+
+
+def make_etag(tag: str, request: Request, user: str) -> str:
+    """
+    ETag da resposta: conteúdo do dataset (BookStore.content_tag) + rota + parâmetros
+    + usuário. O corpo de uma rota de leitura só depende disso (o `user` é
+    ecoado nele).
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(request.url.path.encode())
+    for k, v in sorted(request.query_params.multi_items()):
+        h.update(f"\0{k}={v}".encode())
+    h.update(f"\0{user}".encode())
+    return f'"{tag}-{h.hexdigest()}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in if_none_match.split(","))
+
+
+def cached(max_age: int) -> Callable[..., Dict[str, Any]]:
+    """
+    Factory de dependência para rotas de leitura do catálogo: autentica como
+    auth_required (e retorna os mesmos claims), envia ETag e Cache-Control e,
+    se o If-None-Match do cliente ainda vale, responde 304 sem executar a rota.
+    As respostas são por usuário, então o cache é `private` e varia com o
+    Authorization. Uso: def rota(user=Depends(cached(CATALOG_MAX_AGE))): ...
+    """
+    cache_control = f"private, max-age={max_age}, must-revalidate"
+
+    def _dep(request: Request, response: Response, user: Dict[str, Any] = Depends(auth_required)) -> Dict[str, Any]:
+        etag = make_etag(request.app.state.STORE.content_tag(), request, user["sub"])
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return user
+    return _dep
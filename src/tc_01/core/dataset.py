@@ -0,0 +1,232 @@
+from __future__ import annotations
+import csv
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from tc_01.core.snapshot import SnapshotError, read_snapshot, snapshot_path
+from tc_01.core.store import BookStore
+
+URL_BASE = "https://books.toscrape.com/"
+RATING_MAP = {"One":1, "Two":2, "Three":3, "Four":4, "Five":5}
+
+def parse_price(s: Optional[str]) -> Optional[float]:
+    if not s:
+        return None
+    try:
+        return float(s.replace("£","").strip())
+    except Exception:
+        return None
+
+def parse_rating(s: Optional[str]) -> Optional[int]:
+    if not s:
+        return None
+    return RATING_MAP.get(s.strip(), None)
+
+def parse_availability(s: Optional[str]) -> Dict[str, Any]:
+    """
+    "In stock (19 available)" -> {"in_stock": True, "stock_qty": 19}
+    """
+    if not s:
+        return {"in_stock": False, "stock_qty": 0}
+    s_low = s.lower()
+    in_stock = "in stock" in s_low
+    qty_match = re.search(r"\((\d+)\s+available\)", s_low)
+    qty = int(qty_match.group(1)) if qty_match else 0
+    return {"in_stock": in_stock, "stock_qty": qty}
+
+def absolutize_image(url_fragment: Optional[str]) -> Optional[str]:
+    if not url_fragment:
+        return None
+    # alguns CSV vêm com "../../..", removemos os ../ e resolvemos com urljoin
+    return urljoin(URL_BASE, url_fragment.replace("../", ""))
+
+def parse_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Linha crua (CSV ou scraper) -> dict do livro já tipado."""
+    try:
+        book_id = int(str(row.get("id")).strip()) if row.get("id") else None
+    except Exception:
+        book_id = None
+    price = parse_price(row.get("price"))
+    rating_num = parse_rating(row.get("rating"))
+    avail = parse_availability(row.get("availability"))
+    image_abs = absolutize_image(row.get("image"))
+    return {
+        "id": book_id,
+        "title": (row.get("title") or "").strip(),
+        "price": price,
+        "rating": rating_num,
+        "availability_raw": row.get("availability"),
+        "in_stock": avail["in_stock"],
+        "stock_qty": avail["stock_qty"],
+        "category": (row.get("category") or "").strip(),
+        "image": image_abs,
+    }
+
+def parse_rows(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    items = [parse_row(row) for row in rows]
+    items.sort(key=lambda x: (x["id"] if x["id"] is not None else 1_000_000))
+    return items
+
+def load_books(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        raise FileNotFoundError(f"CSV não encontrado em: {path}")
+    with open(path, newline="", encoding="utf-8") as f:
+        return parse_rows(csv.DictReader(f, delimiter=";"))
+
+def load_store(path: Path, previous: Optional[BookStore] = None, version: int = 1) -> BookStore:
+    """
+    Carrega o catálogo do snapshot binário (se existir e corresponder ao CSV)
+    ou, senão, do próprio CSV.
+    """
+    snap = snapshot_path(path)
+    if snap.exists():
+        try:
+            columns = read_snapshot(snap, source=path)
+            return BookStore(**columns, previous=previous, version=version)
+        except SnapshotError as e:
+            logging.warning(f"Snapshot ignorado ({snap}): {e}")
+    return BookStore.from_records(load_books(path), previous=previous, version=version)
+
+
+# Recarga que encolhe o catálogo abaixo desta fração do atual é recusada (salvo `force`)
+RELOAD_MIN_RATIO = float(os.getenv("DATA_RELOAD_MIN_RATIO", "0.5"))
+
+
+class ReloadRejected(Exception):
+    """O CSV novo não passou na checagem de sanidade; o snapshot atual é mantido."""
+
+
+def _check_reload(store: BookStore, previous: BookStore) -> BookStore:
+    """Recusa um catálogo vazio ou muito menor que o atual (CSV truncado, coleta parcial)."""
+    if len(store) == 0 and len(previous) > 0:
+        raise ReloadRejected("o CSV novo está vazio")
+    if len(store) < len(previous) * RELOAD_MIN_RATIO:
+        raise ReloadRejected(f"o CSV novo tem {len(store)} livros contra {len(previous)} do atual")
+    return store
+
+
+def _file_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime_ns, tamanho) do arquivo; None se ele não existir."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class Dataset:
+    """
+    Dona do snapshot atual do catálogo (`state.STORE`).
+
+    A recarga monta um BookStore novo (com índices) fora do caminho das
+    requisições e só então o publica com uma única atribuição. Requisições em
+    andamento já pegaram a referência do snapshot anterior e terminam nele.
+
+    Com `shared_dir`, o catálogo vive num segmento mapeado em memória e
+    compartilhado entre os workers (ver core/shared.py): só um processo o
+    constrói, os demais anexam; a versão publicada indica quando re-anexar.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        state: Any,
+        poll_interval: float = 5.0,
+        shared_dir: Optional[Path] = None,
+    ) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self._state = state
+        self._shared = None
+        if shared_dir:
+            from tc_01.core.shared import SharedCatalog
+            self._shared = SharedCatalog(Path(shared_dir), path)
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def store(self) -> BookStore:
+        return self._state.STORE
+
+    def load(self) -> BookStore:
+        """Carga inicial (síncrona)."""
+        with self._lock:
+            self._stamp = _file_stamp(self.path)
+            if self._shared is not None:
+                store = self._shared.acquire(lambda prev: load_store(self.path, previous=prev))
+            else:
+                store = load_store(self.path)
+            store.content_tag()  # base dos ETags: calculada antes de publicar, fora das requisições
+            self._state.STORE = store
+        return store
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Recarrega o CSV se ele mudou desde a última carga (ou sempre, com `force`).
+        Retorna True se um snapshot novo foi publicado. Em caso de erro o
+        snapshot atual continua valendo.
+
+        Um CSV vazio ou com menos de RELOAD_MIN_RATIO dos livros atuais é
+        recusado (com aviso no log) e só é aceito com `force`.
+        """
+        with self._lock:
+            stamp = _file_stamp(self.path)
+            if stamp is None or (stamp == self._stamp and not force and not self._shared_moved()):
+                return False
+            previous = self.store
+
+            def build(prev: Optional[BookStore], **kwargs: Any) -> BookStore:
+                store = load_store(self.path, previous=prev, **kwargs)
+                # checado antes de publicar: no modo compartilhado nenhum worker anexa o catálogo recusado
+                return store if force else _check_reload(store, previous)
+
+            try:
+                if self._shared is not None:
+                    store = self._shared.acquire(build, previous, force=force)
+                    if store.version == previous.version:
+                        self._stamp = stamp
+                        return False
+                else:
+                    store = build(previous, version=previous.version + 1)
+                store.content_tag()
+            except ReloadRejected as e:
+                logging.warning(f"Recarga de {self.path} recusada, mantendo a versão {previous.version}: {e}")
+                self._stamp = stamp  # não tenta de novo até o arquivo mudar outra vez
+                return False
+            except Exception as e:
+                logging.warning(f"Falha ao recarregar {self.path}: {e!r}")
+                return False
+            self._state.STORE = store  # troca atômica do snapshot
+            self._stamp = stamp
+        logging.info(f"Dataset recarregado: versão {store.version} ({len(store)} livros)")
+        return True
+
+    def _shared_moved(self) -> bool:
+        """Outro worker publicou uma versão diferente da que temos anexada?"""
+        return self._shared is not None and self._shared.current_version() != self.store.version
+
+    # --------- observação do arquivo ---------
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            if _file_stamp(self.path) != self._stamp or self._shared_moved():
+                self.reload()
+
+    def start_watching(self) -> None:
+        if self.poll_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="dataset-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
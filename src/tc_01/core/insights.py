@@ -0,0 +1,76 @@
+from __future__ import annotations
+import statistics
+from typing import Any, Dict, List
+
+import numpy as np
+
+from tc_01.core.store import BookStore, NO_RATING
+
+# Agregados do catálogo para os endpoints de insights e de categorias. São
+# funções puras do snapshot: os endpoints as chamam via BookStore.memo, então
+# cada uma roda uma vez por versão do dataset.
+
+
+def overview(store: BookStore) -> Dict[str, Any]:
+    """Totais, faixa de preço e distribuição de ratings do catálogo."""
+    prices = store.prices[~np.isnan(store.prices)]
+    ratings = store.ratings[store.ratings != NO_RATING]
+    cats = {c for c in store.categories if c}
+
+    result = {
+        "total_books": len(store),
+        "categories_count": len(cats),
+        "in_stock_count": int(np.count_nonzero(store.in_stock)),
+        "price_min": float(prices.min()) if prices.size else None,
+        "price_max": float(prices.max()) if prices.size else None,
+        "price_avg": round(statistics.mean(prices.tolist()), 2) if prices.size else None,
+        "rating_distribution": {str(k): 0 for k in range(1, 6)}
+    }
+    for r, n in enumerate(np.bincount(ratings, minlength=6).tolist()):
+        if n:
+            result["rating_distribution"][str(r)] = n
+    return result
+
+
+def categories(store: BookStore) -> List[Dict[str, Any]]:
+    """Estatísticas por categoria (contagem, estoque, preço e rating)."""
+    # agrupa códigos de categoria pelo nome exibido ("" -> "Uncategorized")
+    names = [c or "Uncategorized" for c in store.categories]
+    groups = sorted(set(names), key=str.lower)
+    group_of = {name: g for g, name in enumerate(groups)}
+    codes = np.asarray([group_of[n] for n in names], dtype=np.int64)[store.category_codes]
+    k = len(groups)
+
+    has_price = ~np.isnan(store.prices)
+    has_rating = store.ratings != NO_RATING
+    count = np.bincount(codes, minlength=k)
+    in_stock = np.bincount(codes, weights=store.in_stock, minlength=k)
+    price_n = np.bincount(codes, weights=has_price, minlength=k)
+    order = np.argsort(codes[has_price], kind="stable")
+    group_prices = np.split(store.prices[has_price][order], np.cumsum(price_n.astype(np.int64))[:-1])
+    rating_n = np.bincount(codes, weights=has_rating, minlength=k)
+    rating_sum = np.bincount(codes[has_rating], weights=store.ratings[has_rating], minlength=k)
+
+    result = []
+    for g, cat in enumerate(groups):
+        prices = group_prices[g]
+        n_rating = int(rating_n[g])
+        stock_rate = in_stock[g] / count[g] if count[g] > 0 else 0
+        avg_rating = rating_sum[g] / n_rating if n_rating > 0 else None
+        result.append({
+            "category": cat,
+            "books_count": int(count[g]),
+            "in_stock_count": int(in_stock[g]),
+            "in_stock_rate": round(float(stock_rate), 3),
+            "price_avg": round(statistics.mean(prices.tolist()), 2) if prices.size else None,
+            "price_min": float(prices.min()) if prices.size else None,
+            "price_max": float(prices.max()) if prices.size else None,
+            "rating_avg": round(float(avg_rating), 3) if avg_rating is not None else None
+        })
+    return result
+
+
+def category_list(store: BookStore) -> List[Dict[str, Any]]:
+    """Categorias com a contagem de livros, em ordem alfabética."""
+    cnt = store.category_counts()
+    return [{"category": c, "count": cnt[c]} for c in sorted(cnt.keys(), key=str.lower)]
@@ -0,0 +1,366 @@
+from __future__ import annotations
+import fcntl
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from tc_01.scripts.scraping import EXIT_BUSY, EXIT_FAILED
+
+# Jobs finalizados mantidos para consulta
+KEEP_FINISHED = 20
+
+# Intervalo mínimo (s) entre gravações do progresso no arquivo de estado
+PERSIST_INTERVAL = 0.5
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobFiles:
+    """
+    Estado dos jobs em arquivos JSON num diretório ao lado do CSV
+    (books_data.jobs/), visível a todos os workers da API. Cada job tem um
+    `<id>.json` gravado pelo worker que o acompanha: o último snapshot, o pid
+    desse worker e o do processo de scraping. Um `<id>.cancel` pede o
+    cancelamento a quem for o dono.
+    """
+
+    def __init__(self, csv_path: Path) -> None:
+        self.dir = Path(csv_path).with_suffix(".jobs")
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, job_id: str, suffix: str = ".json") -> Path:
+        return self.dir / f"{job_id}{suffix}"
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusão mútua entre os workers ao disparar um job."""
+        with open(self.dir / "trigger.lock", "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def write(self, job_id: str, record: Dict[str, Any]) -> None:
+        path = self._path(job_id)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def read(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.isalnum():  # o id vem da URL
+            return None
+        try:
+            return json.loads(self._path(job_id).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Todos os jobs, do mais recente para o mais antigo."""
+        records = []
+        for path in self.dir.glob("*.json"):
+            try:
+                records.append(json.loads(path.read_text(encoding="utf-8")))
+            except (FileNotFoundError, ValueError):
+                continue
+        records.sort(key=lambda r: r["job"]["created_at"], reverse=True)
+        return records
+
+    def request_cancel(self, job_id: str) -> None:
+        self._path(job_id, ".cancel").touch()
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return self._path(job_id, ".cancel").exists()
+
+    def prune(self, keep: int) -> None:
+        finished = [r for r in self.all() if r["job"]["status"] != "running" or not _alive(r["owner"])]
+        for r in finished[keep:]:
+            for suffix in (".json", ".cancel"):
+                self._path(r["job"]["id"], suffix).unlink(missing_ok=True)
+
+
+class ScrapingJob:
+    """
+    Uma execução do scraper num processo separado.
+
+    O processo filho roda `python -m tc_01.scripts.scraping --progress`, que
+    escreve uma linha JSON por evento no stdout; uma thread leve acompanha
+    essas linhas e o término do processo. O job só guarda o último estado.
+    """
+
+    def __init__(
+        self, csv_path: Path, requested_by: Optional[str], full: bool = False, files: Optional[JobFiles] = None
+    ) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.csv_path = csv_path
+        self.requested_by = requested_by
+        self.full = full
+        self.status = "running"
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.returncode: Optional[int] = None
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.progress: Dict[str, Any] = {}
+        self._baseline: Optional[Tuple[float, int, int, int]] = None  # (t0, páginas, livros, categorias) ao iniciar
+        self._ended: Optional[float] = None
+        self._cancel = False
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._files = files
+        self._persisted = 0.0
+
+    # --------- processo ---------
+    def start(self, on_finish: Callable[["ScrapingJob"], None]) -> None:
+        cmd = [sys.executable, "-m", "tc_01.scripts.scraping", "--progress", "--csv", str(self.csv_path)]
+        if self.full:
+            cmd.append("--full")
+        self._proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            text=True,
+            start_new_session=True,  # grupo próprio: o cancelamento derruba também o pool de parse
+        )
+        self._persist()
+        threading.Thread(target=self._follow, args=(on_finish,), name=f"scraping-job-{self.id}", daemon=True).start()
+
+    def _follow(self, on_finish: Callable[["ScrapingJob"], None]) -> None:
+        proc = self._proc
+        for line in proc.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logging.info(f"[scraping {self.id}] {line.rstrip()}")
+                continue
+            self._on_event(event)
+        returncode = proc.wait()
+        with self._lock:
+            self._ended = time.monotonic()
+            self.returncode = returncode
+            self.finished_at = datetime.now(timezone.utc)
+            if self._cancel or (self._files is not None and self._files.cancel_requested(self.id)):
+                self.status = "cancelled"
+            elif returncode == 0:
+                self.status = "succeeded"
+            else:
+                self.status = "failed"
+                if returncode == EXIT_BUSY:
+                    self.error = "outra coleta já está em andamento"
+                elif returncode != EXIT_FAILED or self.error is None:  # EXIT_FAILED já trouxe o motivo
+                    self.error = f"exit code {returncode}"
+        self._persist()
+        logging.info(f"Job de scraping {self.id}: {self.status}")
+        on_finish(self)
+
+    def _on_event(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if "result" in event:
+                self.result = event["result"]
+                return
+            if "error" in event:
+                self.error = event["error"]
+                return
+            if self._baseline is None:
+                self._baseline = (
+                    time.monotonic(), event.get("pages", 0), event.get("books", 0), event.get("categories_done", 0)
+                )
+            self.progress.update(event)
+        if time.monotonic() - self._persisted >= PERSIST_INTERVAL:
+            self._persist()
+
+    def _persist(self) -> None:
+        """Grava o snapshot no arquivo de estado, para os outros workers."""
+        if self._files is None:
+            return
+        self._persisted = time.monotonic()
+        self._files.write(self.id, {
+            "job": self.snapshot(),
+            "owner": os.getpid(),
+            "pgid": self._proc.pid if self._proc is not None else None,
+        })
+
+    def cancel(self) -> bool:
+        """Encerra o processo (SIGTERM no grupo). O checkpoint permite retomar depois."""
+        with self._lock:
+            if self.status != "running" or self._proc is None:
+                return False
+            self._cancel = True
+        try:
+            os.killpg(self._proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        return True
+
+    # --------- estado ---------
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            progress = dict(self.progress)
+            if self._baseline is not None:
+                t0, pages0, books0, categories0 = self._baseline
+                elapsed = max((self._ended or time.monotonic()) - t0, 1e-9)
+                pages_rate = (progress.get("pages", 0) - pages0) / elapsed
+                categories_rate = (progress.get("categories_done", 0) - categories0) / elapsed
+                progress["elapsed_s"] = round(elapsed, 1)
+                progress["pages_per_s"] = round(pages_rate, 2)
+                progress["books_per_s"] = round((progress.get("books", 0) - books0) / elapsed, 2)
+                if self.status == "running":
+                    progress["eta_s"] = _eta(progress, pages_rate, categories_rate)
+            return {
+                "id": self.id,
+                "status": self.status,
+                "requested_by": self.requested_by,
+                "full": self.full,
+                "created_at": self.created_at.isoformat().replace("+00:00", "Z"),
+                "finished_at": self.finished_at.isoformat().replace("+00:00", "Z") if self.finished_at else None,
+                "progress": progress,
+                "result": self.result,
+                "returncode": self.returncode,
+                "error": self.error,
+            }
+
+
+class StoredJob:
+    """
+    Job acompanhado por outro worker, lido do arquivo de estado. O snapshot é
+    o último gravado pelo dono; se o dono morreu com o job em andamento, o
+    job aparece como falho.
+    """
+
+    def __init__(self, record: Dict[str, Any], files: JobFiles) -> None:
+        self.record = record
+        self.id = record["job"]["id"]
+        self._files = files
+
+    @property
+    def running(self) -> bool:
+        return self.record["job"]["status"] == "running" and _alive(self.record["owner"])
+
+    @property
+    def status(self) -> str:
+        return self.snapshot()["status"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap = dict(self.record["job"])
+        if snap["status"] == "running" and not _alive(self.record["owner"]):
+            snap["status"] = "failed"
+            snap["error"] = "o worker da API que acompanhava o job foi encerrado"
+        return snap
+
+    def cancel(self) -> bool:
+        """Pede o cancelamento ao dono e encerra o processo de scraping."""
+        if not self.running:
+            return False
+        self._files.request_cancel(self.id)
+        try:
+            os.killpg(self.record["pgid"], signal.SIGTERM)
+        except (ProcessLookupError, TypeError):
+            pass
+        return True
+
+
+AnyJob = Union[ScrapingJob, StoredJob]
+
+
+def _eta(progress: Dict[str, Any], pages_rate: float, categories_rate: float) -> Optional[float]:
+    """
+    Tempo restante estimado: pelas páginas, se a coleta anterior deixou o
+    total esperado; senão pelo ritmo de categorias concluídas.
+    """
+    expected = progress.get("expected_pages")
+    if expected and pages_rate > 0:
+        return round(max(expected - progress.get("pages", 0), 0) / pages_rate, 1)
+    total = progress.get("categories")
+    if total and categories_rate > 0:
+        return round((total - progress.get("categories_done", 0)) / categories_rate, 1)
+    return None
+
+
+class ScrapingJobs:
+    """
+    Gerencia os jobs de scraping da API: no máximo um em execução. Disparos
+    concorrentes recebem o job que já está rodando em vez de iniciar outra
+    coleta (single-flight), também entre workers: o disparo é serializado
+    por um lock de arquivo e o estado dos jobs fica em JobFiles, ao lado do
+    CSV. Cada job é acompanhado pelo worker que o disparou; os demais leem o
+    último estado gravado por ele.
+    """
+
+    def __init__(self, csv_path: Path, on_success: Optional[Callable[[], Any]] = None) -> None:
+        self.csv_path = csv_path
+        self.on_success = on_success
+        self._files = JobFiles(csv_path)
+        self._jobs: "OrderedDict[str, ScrapingJob]" = OrderedDict()
+        self._running: Optional[ScrapingJob] = None
+        self._lock = threading.Lock()
+
+    def trigger(self, requested_by: Optional[str] = None, full: bool = False) -> Tuple[AnyJob, bool]:
+        """Retorna (job, criado_agora)."""
+        with self._lock, self._files.locked():
+            if self._running is not None:
+                return self._running, False
+            for record in self._files.all():
+                stored = StoredJob(record, self._files)
+                if stored.running:
+                    return stored, False
+            job = ScrapingJob(self.csv_path, requested_by, full=full, files=self._files)
+            self._jobs[job.id] = job
+            self._running = job
+            self._prune()
+            try:
+                job.start(self._finished)
+            except OSError as e:
+                with job._lock:
+                    job.status, job.error = "failed", repr(e)
+                    job.finished_at = datetime.now(timezone.utc)
+                job._persist()
+                self._running = None
+        return job, True
+
+    def _finished(self, job: ScrapingJob) -> None:
+        with self._lock:
+            if self._running is job:
+                self._running = None
+        # hook pós-scraping: publica o CSV novo sem esperar o watcher
+        if job.status == "succeeded" and self.on_success is not None:
+            self.on_success()
+
+    def _prune(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j is not self._running]
+        for jid in finished[: max(len(finished) - KEEP_FINISHED, 0)]:
+            del self._jobs[jid]
+        self._files.prune(KEEP_FINISHED)
+
+    def get(self, job_id: str) -> Optional[AnyJob]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = self._files.read(job_id)
+        return StoredJob(record, self._files) if record is not None else None
+
+    def list(self) -> List[AnyJob]:
+        return [self._jobs.get(r["job"]["id"]) or StoredJob(r, self._files) for r in self._files.all()]
+
+    def shutdown(self) -> None:
+        """Cancela o job em execução neste worker (chamado ao desligar a API)."""
+        job = self._running
+        if job is not None:
+            job.cancel()
@@ -1,27 +1,84 @@
-import time
-from starlette.middleware.base import BaseHTTPMiddleware
+import atexit
 import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+from tc_01.config.variables import Config
+from tc_01.core.metrics import UNMATCHED, rollup_summary
+from tc_01.core.requestlog import RequestLog
+
+LOG_DIR = Config.LOG_DIR
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+LOG_FILE = Path(os.getenv("LOG_FILE", LOG_DIR / "api_logs.log"))
+
+# Linha de texto por requisição no api_logs.log (o registro estruturado em
+# LOG_DIR/requests é sempre gravado; as métricas não dependem do texto)
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "0").lower() not in ("0", "false", "no")
+
+# Configura o logger: os registros vão para uma fila e uma thread
+# (QueueListener) grava no arquivo, fora do event loop
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_file_handler = logging.FileHandler(LOG_FILE)
+_file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter("%(message)s"))  # o formato final é o do arquivo
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+
+_listener = QueueListener(_log_queue, _file_handler, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)  # descarrega a fila ao sair
+
+# Log estruturado das requisições (NDJSON com rotação e segmentos .gz),
+# compartilhado pelos workers; gravado e acompanhado por threads próprias.
+# Cada segmento arquivado leva o resumo das séries temporais das métricas
+REQUEST_LOG = RequestLog(LOG_DIR / "requests", summarize=rollup_summary)
+REQUEST_LOG.start()
+atexit.register(REQUEST_LOG.stop)
+
+
+class LogRequestsMiddleware:
+    """
+    Middleware ASGI que registra todas as requisições HTTP da API no log
+    estruturado (e, opcionalmente, no log de texto); o registro de métricas
+    (app.state.metrics) é alimentado a partir dele. O status vem da mensagem
+    http.response.start e a latência vai até o fim do envio da resposta
+    (inclusive respostas em streaming). Streams de eventos (SSE), que ficam
+    abertos indefinidamente, contam só até o início da resposta.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter_ns()
+        status = 500  # se a app falhar antes de responder
+        started_at = None  # fim da medição para event streams
+
+        async def send_wrapper(message):
+            nonlocal status, started_at
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if any(k == b"content-type" and v.startswith(b"text/event-stream") for k, v in message.get("headers", ())):
+                    started_at = time.perf_counter_ns()
+            await send(message)
 
-# Configura o logger
-logging.basicConfig(
-    filename="api_logs.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
-class LogRequestsMiddleware(BaseHTTPMiddleware):
-    """Middleware que registra todas as requisições HTTP da API."""
-
-    async def dispatch(self, request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-
-        log_message = (
-            f"{request.method} {request.url.path} "
-            f"status={response.status_code} "
-            f"{process_time:.3f}s"
-        )
-        logging.info(log_message)
-
-        return response
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            process_time = ((started_at or time.perf_counter_ns()) - start) / 1e9
+            ts = time.time()
+            method, path = scope["method"], scope["path"]
+            route = getattr(scope.get("route"), "path", None)  # preenchido pelo roteador do FastAPI
+            REQUEST_LOG.submit({
+                "ts": ts, "method": method, "path": path, "route": route or UNMATCHED,
+                "status": status, "latency_s": round(process_time, 6),
+            })
+            if LOG_REQUESTS:
+                logging.info("%s %s status=%d %.3fs", method, path, status, process_time)
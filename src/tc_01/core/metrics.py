@@ -0,0 +1,578 @@
+from __future__ import annotations
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from tc_01.core.requestlog import RequestLog
+
+# Entradas recentes guardadas para /metrics/entries (limite máximo do endpoint)
+ENTRIES_BUFFER = int(os.getenv("METRICS_ENTRIES_BUFFER", "10000"))
+
+# Requisições que não casaram com nenhuma rota (404 de caminhos arbitrários)
+# ficam todas sob a mesma chave, para a cardinalidade não crescer sem limite
+UNMATCHED = "(sem rota)"
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# (timestamp epoch, método, path, rota, status, latência em s)
+Entry = Tuple[float, str, str, str, int, float]
+
+# ---------------- Histogramas de latência ----------------
+# Baldes logarítmicos (à la HDR): de 10 µs a ~2 min, cada um 4% mais largo
+# que o anterior -> percentis com erro relativo de no máximo 4%.
+HIST_MIN_S = 1e-5
+HIST_GROWTH = 1.04
+HIST_BUCKETS = 2 + int(math.log(120 / HIST_MIN_S) / math.log(HIST_GROWTH))
+_LOG_GROWTH = math.log(HIST_GROWTH)
+# limite superior de cada balde (o último é aberto)
+_BUCKET_UPPER = HIST_MIN_S * HIST_GROWTH ** np.arange(HIST_BUCKETS)
+
+# Janela deslizante: uma fatia por minuto, guardando a última hora
+SLOT_SECONDS = 60
+SLOTS = 60
+WINDOWS = {"1m": 1, "5m": 5, "15m": 15, "60m": 60}
+PERCENTILES = (50, 90, 95, 99)
+
+# Séries temporais pré-agregadas: passo -> (segundos, baldes guardados)
+ROLLUP_STEPS = {
+    "1m": (60, int(os.getenv("METRICS_ROLLUP_MINUTES", str(24 * 60)))),
+    "1h": (3600, int(os.getenv("METRICS_ROLLUP_HOURS", str(7 * 24)))),
+}
+
+
+def format_ts(ts: float) -> str:
+    """Mesmo formato do asctime do logging (hora local, milissegundos com vírgula)."""
+    seconds, ms = divmod(int(round(ts * 1000)), 1000)
+    return time.strftime(_TS_FORMAT, time.localtime(seconds)) + f",{ms:03d}"
+
+
+def _bucket(latency_s: float) -> int:
+    if latency_s <= HIST_MIN_S:
+        return 0
+    return min(int(math.log(latency_s / HIST_MIN_S) / _LOG_GROWTH) + 1, HIST_BUCKETS - 1)
+
+
+class LatencyHistogram:
+    """
+    Histograma de latências com janela deslizante e memória fixa: SLOTS
+    fatias de SLOT_SECONDS, cada uma com HIST_BUCKETS contadores e o máximo
+    observado. Uma fatia é zerada quando o relógio volta a cair nela, então
+    uma consulta soma só as fatias dentro da janela pedida.
+    """
+
+    def __init__(self) -> None:
+        self.counts = np.zeros((SLOTS, HIST_BUCKETS), dtype=np.uint32)
+        self.maxes = np.zeros(SLOTS, dtype=np.float64)
+        self.slot_ids = np.full(SLOTS, -1, dtype=np.int64)  # minuto (epoch // SLOT_SECONDS) de cada fatia
+
+    def record(self, latency_s: float, ts: float, bucket: int) -> None:
+        slot_id = int(ts // SLOT_SECONDS)
+        i = slot_id % SLOTS
+        current = self.slot_ids[i]
+        if slot_id != current:
+            if slot_id < current:  # mais antigo que a fatia atual: já saiu da janela
+                return
+            self.counts[i] = 0
+            self.maxes[i] = 0.0
+            self.slot_ids[i] = slot_id
+        self.counts[i, bucket] += 1
+        if latency_s > self.maxes[i]:
+            self.maxes[i] = latency_s
+
+    def window(self, slots: int, now: float) -> Tuple[np.ndarray, float]:
+        """(contagens por balde, máximo) das últimas `slots` fatias até `now`."""
+        current = int(now // SLOT_SECONDS)
+        live = (self.slot_ids > current - slots) & (self.slot_ids <= current)
+        return self.counts[live].sum(axis=0, dtype=np.uint64), float(self.maxes[live].max(initial=0.0))
+
+
+def summarize(counts: np.ndarray, max_s: float) -> Dict[str, Any]:
+    """count, p50/p90/p95/p99 (limite superior do balde, até o máximo) e max."""
+    total = int(counts.sum())
+    summary: Dict[str, Any] = {"count": total}
+    cumulative = np.cumsum(counts)
+    for p in PERCENTILES:
+        if total:
+            rank = max(math.ceil(total * p / 100), 1)
+            value = min(float(_BUCKET_UPPER[np.searchsorted(cumulative, rank)]), max_s)
+        else:
+            value = 0.0
+        summary[f"p{p}"] = round(value, 6)
+    summary["max"] = round(max_s, 6)
+    return summary
+
+
+class _Cell:
+    """Agregado de um balde de tempo para uma (rota, método)."""
+
+    __slots__ = ("count", "classes", "latency_sum", "max", "hist")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.classes: Dict[str, int] = {}
+        self.latency_sum = 0.0
+        self.max = 0.0
+        self.hist: Dict[int, int] = {}  # esparso: só os baldes de latência observados
+
+    def add(self, status: int, latency_s: float, bucket: int) -> None:
+        self.count += 1
+        status_class = f"{status // 100}xx"
+        self.classes[status_class] = self.classes.get(status_class, 0) + 1
+        self.latency_sum += latency_s
+        if latency_s > self.max:
+            self.max = latency_s
+        self.hist[bucket] = self.hist.get(bucket, 0) + 1
+
+    def merge(self, other: "_Cell") -> None:
+        self.count += other.count
+        self.latency_sum += other.latency_sum
+        self.max = max(self.max, other.max)
+        for k, v in other.classes.items():
+            self.classes[k] = self.classes.get(k, 0) + v
+        for b, v in other.hist.items():
+            self.hist[b] = self.hist.get(b, 0) + v
+
+
+class Rollup:
+    """
+    Baldes de tempo de `step` segundos (os últimos `retention`), cada um com
+    um _Cell por (rota, método). Baldes velhos saem quando surge um novo.
+    """
+
+    def __init__(self, step: int, retention: int) -> None:
+        self.step = step
+        self.retention = retention
+        self.buckets: Dict[int, Dict[Tuple[str, str], _Cell]] = {}
+        self._latest = 0
+
+    def _cell(self, b: int, route: str, method: str) -> Optional[_Cell]:
+        cells = self.buckets.get(b)
+        if cells is None:
+            if b <= self._latest - self.retention:
+                return None  # mais antigo que a retenção
+            cells = self.buckets[b] = {}
+            if b > self._latest:
+                self._latest = b
+                for old in [k for k in self.buckets if k <= b - self.retention]:
+                    del self.buckets[old]
+        cell = cells.get((route, method))
+        if cell is None:
+            cell = cells[(route, method)] = _Cell()
+        return cell
+
+    def add(self, ts: float, route: str, method: str, status: int, latency_s: float, bucket: int) -> None:
+        cell = self._cell(int(ts // self.step), route, method)
+        if cell is not None:
+            cell.add(status, latency_s, bucket)
+
+    def dump(self) -> List[List[Any]]:
+        """Baldes em forma de JSON: [balde, rota, método, count, classes, soma, máx, [[balde lat., n], ...]]."""
+        return [
+            [b, route, method, cell.count, cell.classes, cell.latency_sum, cell.max, sorted(cell.hist.items())]
+            for b, cells in self.buckets.items()
+            for (route, method), cell in cells.items()
+        ]
+
+    def merge_dump(self, rows: List[List[Any]]) -> None:
+        """Soma baldes gravados por `dump` (de outro Rollup com o mesmo `step`)."""
+        for b, route, method, count, classes, latency_sum, max_s, hist in rows:
+            cell = self._cell(b, route, method)
+            if cell is None:
+                continue
+            other = _Cell()
+            other.count, other.classes, other.latency_sum, other.max = count, classes, latency_sum, max_s
+            other.hist = dict(map(tuple, hist))
+            cell.merge(other)
+
+    def collect(
+        self,
+        start: float,
+        end: float,
+        route: Optional[str] = None,
+        method: Optional[str] = None,
+        group_by: Optional[str] = None,
+    ) -> List[Tuple[float, str, _Cell]]:
+        """
+        (início do balde, grupo, agregado) para os baldes com dados em
+        [start, end], somando as (rota, método) de cada grupo. Só junta
+        dicionários; percentis e formatação ficam para `timeseries_point`.
+        """
+        out = []
+        for b in sorted(k for k in self.buckets if start // self.step <= k <= end // self.step):
+            groups: Dict[str, _Cell] = {}
+            for (r, m), cell in self.buckets[b].items():
+                if (route and r != route) or (method and m != method):
+                    continue
+                key = r if group_by == "route" else m if group_by == "method" else ""
+                merged = groups.get(key)
+                if merged is None:
+                    merged = groups[key] = _Cell()
+                merged.merge(cell)
+            out.extend((b * self.step, key, groups[key]) for key in sorted(groups))
+        return out
+
+
+def _sparse_percentiles(hist: Dict[int, int], total: int, max_s: float) -> Dict[str, float]:
+    """Mesmo critério de summarize(), sobre o histograma esparso de um _Cell."""
+    out: Dict[str, float] = {}
+    items = sorted(hist.items())
+    i, cumulative = 0, 0
+    for p in PERCENTILES:
+        rank = max(math.ceil(total * p / 100), 1)
+        while cumulative + items[i][1] < rank:
+            cumulative += items[i][1]
+            i += 1
+        out[f"p{p}"] = round(min(float(_BUCKET_UPPER[items[i][0]]), max_s), 6)
+    out["max"] = round(max_s, 6)
+    return out
+
+
+def timeseries_point(ts: float, cell: _Cell) -> Dict[str, Any]:
+    errors = cell.classes.get("4xx", 0) + cell.classes.get("5xx", 0)
+    return {
+        "ts": datetime.fromtimestamp(ts).isoformat(),
+        "count": cell.count,
+        "status_classes": dict(sorted(cell.classes.items())),
+        "error_rate": round(errors / cell.count, 6),
+        "latency_avg_s": round(cell.latency_sum / cell.count, 6),
+        **_sparse_percentiles(cell.hist, cell.count, cell.max),
+    }
+
+
+def rollup_summary(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Séries temporais de um segmento do log estruturado, uma por passo, no
+    formato de Rollup.dump. Gravadas ao lado do segmento quando ele é
+    arquivado (RequestLog.summarize), para o preload não precisar reler os
+    registros.
+    """
+    buckets = [_bucket(rec["latency_s"]) for rec in records]
+    summary = {}
+    for step, (seconds, retention) in ROLLUP_STEPS.items():
+        rollup = Rollup(seconds, retention)
+        for rec, bucket in zip(records, buckets):
+            rollup.add(rec["ts"], rec["route"], rec["method"], rec["status"], rec["latency_s"], bucket)
+        summary[f"rollup-{step}"] = {"seconds": seconds, "rows": rollup.dump()}
+    return summary
+
+
+def to_entry(rec: Dict[str, Any]) -> Entry:
+    """Registro do log estruturado (tc_01.core.requestlog) -> Entry."""
+    return rec["ts"], rec["method"], rec["path"], rec["route"], rec["status"], rec["latency_s"]
+
+
+def entry_filter(
+    method: Optional[str] = None,
+    path_contains: Optional[str] = None,
+    status_min: int = 100,
+    status_max: int = 599,
+) -> Callable[[Entry], bool]:
+    """Predicado dos filtros de /metrics/entries sobre uma entrada."""
+    needle = path_contains.lower() if path_contains else None
+
+    def match(e: Entry) -> bool:
+        if method and e[1] != method:
+            return False
+        if needle and needle not in e[2].lower():
+            return False
+        return status_min <= e[4] <= status_max
+
+    return match
+
+
+def select_entries(
+    newest_first: Iterable[Entry],
+    limit: int,
+    method: Optional[str] = None,
+    path_contains: Optional[str] = None,
+    status_min: int = 100,
+    status_max: int = 599,
+    newest_seq: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    As `limit` entradas mais recentes que passam nos filtros, formatadas, da
+    mais antiga para a mais recente. Para de consumir `newest_first` ao
+    completar o limite. Com `newest_seq` (a sequência da primeira entrada de
+    `newest_first`), cada entrada sai com sua `seq`.
+    """
+    match = entry_filter(method, path_contains, status_min, status_max)
+    selected: List[Tuple[int, Entry]] = []
+    for k, e in enumerate(newest_first):
+        if not match(e):
+            continue
+        selected.append((k, e))
+        if len(selected) == limit:
+            break
+    if newest_seq is None:
+        return [format_entry(e) for _, e in reversed(selected)]
+    return [dict(format_entry(e), seq=newest_seq - k) for k, e in reversed(selected)]
+
+
+def format_entry(e: Entry) -> Dict[str, Any]:
+    ts, method, path, route, status, latency_s = e
+    return {
+        "timestamp": format_ts(ts),
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "latency_s": round(latency_s, 6),
+    }
+
+
+class MetricsRegistry:
+    """
+    Métricas de requisições em memória: contadores por rota e por classe de
+    status, soma de latências, um histograma de latência por rota e um
+    buffer circular com as últimas entradas. As rotas são agregadas pelo
+    template (/api/v1/books/{book_id}), não pelo caminho bruto. Os endpoints
+    de /metrics leem daqui, sem passar pelo arquivo de log.
+
+    O registro é alimentado pelo log estruturado (`RequestLog.follow`), que
+    recebe as requisições de todos os workers: cada processo vê as mesmas
+    requisições na mesma ordem, então totais, `seq` e cursores valem em
+    qualquer worker. A contrapartida é um atraso de até
+    REQUEST_LOG_POLL_S entre a requisição e as métricas.
+    """
+
+    def __init__(self, max_entries: int = ENTRIES_BUFFER) -> None:
+        self._lock = threading.Lock()
+        self._entries: Deque[Entry] = deque(maxlen=max_entries)
+        self.total = 0
+        self.latency_sum = 0.0
+        self.routes: Dict[str, int] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.status_classes: Dict[str, int] = {}
+        self.errors = 0
+        self.rollups = {step: Rollup(seconds, retention) for step, (seconds, retention) in ROLLUP_STEPS.items()}
+
+    def ingest(self, records: List[Dict[str, Any]]) -> None:
+        """Registros novos do log estruturado, na ordem do log."""
+        with self._lock:
+            for rec in records:
+                e = to_entry(rec)
+                ts, method, _, route, status, latency_s = e
+                status_class = f"{status // 100}xx"
+                bucket = _bucket(latency_s)
+                self._entries.append(e)
+                self.total += 1
+                self.latency_sum += latency_s
+                self.routes[route] = self.routes.get(route, 0) + 1
+                hist = self.histograms.get(route)
+                if hist is None:
+                    hist = self.histograms[route] = LatencyHistogram()
+                hist.record(latency_s, ts, bucket)
+                for rollup in self.rollups.values():
+                    rollup.add(ts, route, method, status, latency_s, bucket)
+                self.status_classes[status_class] = self.status_classes.get(status_class, 0) + 1
+                if status >= 400:
+                    self.errors += 1
+
+    def preload(self, request_log: RequestLog) -> int:
+        """
+        Recompõe o registro a partir do log estruturado, para que o histórico
+        sobreviva a reinícios da API. Os totais vêm dos índices dos segmentos
+        e as séries temporais, dos resumos gravados no arquivamento
+        (rollup_summary); só o segmento ativo é relido por inteiro. Dos
+        arquivados, relê apenas o necessário para o buffer de entradas e a
+        janela dos histogramas (a última hora). Chamado uma única vez, na
+        subida, via RequestLog.follow (antes de `ingest` começar a receber).
+        """
+        totals = request_log.totals()
+        now = time.time()
+        hist_cutoff = now - SLOTS * SLOT_SECONDS
+        recent: List[Entry] = []
+        n = 0
+
+        def replay(rec: Dict[str, Any], rollups: bool) -> None:
+            e = to_entry(rec)
+            ts, method, _, route, status, latency_s = e
+            bucket = _bucket(latency_s)
+            if len(recent) < self._entries.maxlen:
+                recent.append(e)
+            if ts >= hist_cutoff:
+                hist = self.histograms.get(route)
+                if hist is None:
+                    hist = self.histograms[route] = LatencyHistogram()
+                hist.record(latency_s, ts, bucket)
+            if rollups:
+                for rollup in self.rollups.values():
+                    rollup.add(ts, route, method, status, latency_s, bucket)
+
+        with self._lock:
+            self.total += totals["count"]
+            self.latency_sum += totals["latency_sum"]
+            self.errors += totals["errors"]
+            for route, count in totals["routes"].items():
+                self.routes[route] = self.routes.get(route, 0) + count
+            for status_class, count in totals["status_classes"].items():
+                self.status_classes[status_class] = self.status_classes.get(status_class, 0) + count
+            # segmento ativo (ainda sem resumo): tudo, do mais novo para o mais antigo
+            for rec in request_log.iter_reverse(archived=False):
+                n += 1
+                replay(rec, rollups=True)
+            # séries dos arquivados: resumos, cada passo só dentro da sua retenção
+            since = min(now - seconds * retention for seconds, retention in ROLLUP_STEPS.values())
+            for segment in request_log.archived(since):
+                missing = []
+                for step, rollup in self.rollups.items():
+                    if segment.end < now - rollup.step * rollup.retention:
+                        continue
+                    summary = segment.summary(f"rollup-{step}")
+                    if summary is not None and summary["seconds"] == rollup.step:
+                        rollup.merge_dump(summary["rows"])
+                    else:
+                        missing.append(rollup)
+                if missing:  # arquivado sem resumo: relê os registros
+                    for rec in segment.records():
+                        bucket = _bucket(rec["latency_s"])
+                        for rollup in missing:
+                            rollup.add(rec["ts"], rec["route"], rec["method"], rec["status"], rec["latency_s"], bucket)
+            # registros dos arquivados: buffer de entradas e janela dos histogramas
+            for rec in request_log.iter_reverse(active=False):
+                if len(recent) >= self._entries.maxlen and rec["ts"] < hist_cutoff:
+                    break
+                n += 1
+                replay(rec, rollups=False)
+            self._entries.extend(reversed(recent))
+        logging.info(f"Métricas: {totals['count']} requisições no histórico, {n} relidas")
+        return totals["count"]
+
+    def timeseries(
+        self,
+        step: str,
+        start: float,
+        end: float,
+        route: Optional[str] = None,
+        method: Optional[str] = None,
+        group_by: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Pontos da série `step` ("1m" ou "1h") em [start, end] (epoch)."""
+        with self._lock:
+            collected = self.rollups[step].collect(start, end, route, method, group_by)
+        points = []
+        for ts, key, cell in collected:
+            point = timeseries_point(ts, cell)
+            if group_by:
+                point[group_by] = key
+            points.append(point)
+        return points
+
+    def latency(self, window: str = "5m", now: Optional[float] = None) -> Dict[str, Any]:
+        """Percentis de latência na janela (geral e por rota, da rota mais usada para a menos)."""
+        slots = WINDOWS[window]
+        now = time.time() if now is None else now
+        all_counts = np.zeros(HIST_BUCKETS, dtype=np.uint64)
+        all_max = 0.0
+        per_route = []
+        with self._lock:
+            for route, hist in self.histograms.items():
+                counts, max_s = hist.window(slots, now)
+                summary = summarize(counts, max_s)
+                if summary["count"]:
+                    per_route.append((route, summary))
+                    all_counts += counts
+                    all_max = max(all_max, max_s)
+        per_route.sort(key=lambda kv: kv[1]["count"], reverse=True)
+        return {"window": window, "all": summarize(all_counts, all_max), "routes": dict(per_route)}
+
+    def overview(self, window: str = "5m") -> Dict[str, Any]:
+        latency = self.latency(window)
+        with self._lock:
+            total = self.total
+            top = sorted(self.routes.items(), key=lambda kv: kv[1], reverse=True)[:20]
+            return {
+                "total_requests": total,
+                "avg_response_time_s": round(self.latency_sum / total, 6) if total else 0.0,
+                "top_endpoints": dict(top),
+                "status_classes": dict(sorted(self.status_classes.items())),
+                "errors": {
+                    "4xx_count": self.status_classes.get("4xx", 0),
+                    "5xx_count": self.status_classes.get("5xx", 0),
+                    "error_rate": round(self.errors / total, 6) if total else 0.0,
+                },
+                "latency": latency,
+            }
+
+    def entries(
+        self,
+        limit: int,
+        method: Optional[str] = None,
+        path_contains: Optional[str] = None,
+        status_min: int = 100,
+        status_max: int = 599,
+        after: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Entradas do buffer que passam nos filtros, da mais antiga para a mais
+        recente, cada uma com sua `seq` (a posição da requisição na contagem
+        total), e o cursor para a próxima chamada.
+
+        Sem `after`, devolve as `limit` mais recentes. Com `after`, só as de
+        seq > after, a partir da mais antiga: o custo é proporcional às
+        requisições novas, não ao buffer. `next_cursor` é a seq da última
+        entrada examinada (passando ou não nos filtros), então repetir a
+        chamada com after=next_cursor continua dali sem buracos. `dropped`
+        conta as entradas que já saíram do buffer; `reset` indica um cursor à
+        frente do total (a API reiniciou sem histórico) e a resposta recomeça
+        do buffer.
+        """
+        with self._lock:
+            seq = self.total
+            if after is None:
+                newest = list(self._entries)
+            else:
+                reset = after > seq
+                if reset:
+                    after = seq - len(self._entries)
+                new = max(min(seq - after, len(self._entries)), 0)
+                tail = list(islice(reversed(self._entries), new))
+        if after is None:
+            entries = select_entries(reversed(newest), limit, method, path_contains, status_min, status_max, newest_seq=seq)
+            return {"entries": entries, "next_cursor": seq, "dropped": 0, "reset": False}
+
+        match = entry_filter(method, path_contains, status_min, status_max)
+        first = seq - new + 1
+        entries: List[Dict[str, Any]] = []
+        cursor = seq
+        for i, e in enumerate(reversed(tail)):
+            if match(e):
+                entries.append(dict(format_entry(e), seq=first + i))
+                if len(entries) == limit:
+                    cursor = first + i
+                    break
+        return {"entries": entries, "next_cursor": cursor, "dropped": max(seq - after - new, 0), "reset": reset}
+
+    def counters(self) -> Dict[str, Any]:
+        """Contadores acumulados (cópia), base para os deltas do stream."""
+        return {
+            "total_requests": self.total,
+            "latency_sum_s": self.latency_sum,
+            "errors": self.errors,
+            "routes": dict(self.routes),
+            "status_classes": dict(self.status_classes),
+        }
+
+    def changes(self, after: int) -> Tuple[int, Dict[str, Any], List[Dict[str, Any]], int]:
+        """
+        (seq, contadores, entradas novas, entradas perdidas) desde a sequência
+        `after`. A sequência é o total de requisições: cada uma acrescenta
+        exatamente uma entrada ao buffer, então as `seq - after` últimas são
+        as novas (se ainda couberem no buffer; o resto conta como perdido).
+        """
+        with self._lock:
+            seq = self.total
+            counters = self.counters()
+            new = max(min(seq - after, len(self._entries)), 0)
+            tail = list(islice(reversed(self._entries), new))[::-1]
+        dropped = max(seq - after - new, 0)
+        entries = [dict(format_entry(e), seq=seq - new + 1 + i) for i, e in enumerate(tail)]
+        return seq, counters, entries, dropped
@@ -0,0 +1,591 @@
+"""
+Log estruturado das requisições (NDJSON) com rotação e arquivamento.
+
+Layout em LOG_DIR/requests:
+  requests.ndjson                        segmento ativo (texto, uma linha JSON por requisição)
+  requests-<início>.ndjson.gz            segmentos arquivados
+  requests-<início>.ndjson.gz.idx.json   índice de cada segmento arquivado
+  requests-<início>.ndjson.gz.<chave>.json  resumos opcionais do segmento (hook `summarize`)
+  retired.json                           agregados dos segmentos já apagados pela retenção
+  lock                                   flock que coordena os processos
+
+O segmento ativo é um só para todos os workers da API: cada processo grava
+seus registros em lotes com O_APPEND sob um flock exclusivo, e quem encontra
+o segmento cheio (tamanho ou idade) o arquiva ali mesmo, ainda com o lock.
+Ao arquivar, cada bloco de BLOCK_RECORDS linhas vira um membro gzip
+independente (o arquivo continua sendo um .gz válido), e o índice guarda,
+por bloco, o intervalo de tempo e o offset/tamanho no arquivo. Assim uma
+consulta por janela de tempo pula segmentos e blocos fora do intervalo e
+descomprime só o necessário. O índice também traz os agregados do segmento
+(contagens por rota/status, soma de latências), para a API recompor os
+totais sem reler os registros. Quem precisa de mais que isso (as séries
+temporais das métricas) passa um `summarize`, que devolve um dicionário de
+resumos; cada um é gravado num arquivo ao lado do segmento, no
+arquivamento, e lido de volta à parte com `Segment.summary`.
+
+Para ler, cada processo acompanha o segmento ativo como um `tail -f`
+(índice de blocos em memória, atualizado por uma thread) e relê a lista de
+segmentos arquivados quando percebe uma rotação. Os registros novos são
+entregues a quem segue o log (`follow`): é assim que as métricas de cada
+worker enxergam as requisições de todos, na mesma ordem.
+"""
+from __future__ import annotations
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+SEGMENT_MAX_BYTES = int(os.getenv("REQUEST_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+SEGMENT_MAX_AGE_S = float(os.getenv("REQUEST_LOG_MAX_AGE_S", "3600"))
+# Segmentos arquivados mantidos em disco (0 = sem limite)
+KEEP_SEGMENTS = int(os.getenv("REQUEST_LOG_KEEP", "168"))
+# Intervalo máximo (s) entre leituras do segmento ativo pela thread de tail
+POLL_INTERVAL = float(os.getenv("REQUEST_LOG_POLL_S", "0.25"))
+BLOCK_RECORDS = 1024
+# Registros gravados por lote (uma aquisição do flock)
+WRITE_BATCH = 512
+
+ACTIVE_NAME = "requests.ndjson"
+RETIRED_NAME = "retired.json"
+LOCK_NAME = "lock"
+INDEX_SUFFIX = ".idx.json"
+SUMMARY_SUFFIX = ".summary-{}.json"
+
+# Bloco: [ts inicial, ts final, offset, tamanho em bytes, registros]
+Block = List[Any]
+
+_FIELDS = ("ts", "method", "path", "route", "status", "latency_s")
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def new_stats() -> Dict[str, Any]:
+    return {"count": 0, "latency_sum": 0.0, "routes": {}, "status_classes": {}, "errors": 0}
+
+
+def add_record(stats: Dict[str, Any], rec: Dict[str, Any]) -> None:
+    stats["count"] += 1
+    stats["latency_sum"] += rec["latency_s"]
+    stats["routes"][rec["route"]] = stats["routes"].get(rec["route"], 0) + 1
+    status_class = f"{rec['status'] // 100}xx"
+    stats["status_classes"][status_class] = stats["status_classes"].get(status_class, 0) + 1
+    if rec["status"] >= 400:
+        stats["errors"] += 1
+
+
+def merge_stats(into: Dict[str, Any], other: Dict[str, Any]) -> None:
+    into["count"] += other["count"]
+    into["latency_sum"] += other["latency_sum"]
+    into["errors"] += other["errors"]
+    for key in ("routes", "status_classes"):
+        for k, v in other[key].items():
+            into[key][k] = into[key].get(k, 0) + v
+
+
+def _write_json(path: Path, payload: Dict[str, Any]) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _parse(line: bytes) -> Optional[Dict[str, Any]]:
+    """Registro de uma linha do log, ou None se a linha estiver corrompida."""
+    try:
+        rec = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(rec, dict) or any(k not in rec for k in _FIELDS):
+        return None
+    return rec
+
+
+class _Index:
+    """Blocos e agregados de um segmento em texto, montados linha a linha."""
+
+    def __init__(self) -> None:
+        self.blocks: List[Block] = []
+        self.stats = new_stats()
+        self.size = 0
+
+    def add(self, line: bytes) -> Optional[Dict[str, Any]]:
+        rec = _parse(line)
+        if rec is None:  # linha corrompida: fica no bloco atual, a leitura a ignora
+            if not self.blocks:
+                self.blocks.append([0.0, 0.0, self.size, 0, 0])
+            self.blocks[-1][3] += len(line)
+        else:
+            ts = rec["ts"]
+            if not self.blocks or self.blocks[-1][4] >= BLOCK_RECORDS:
+                self.blocks.append([ts, ts, self.size, 0, 0])
+            block = self.blocks[-1]
+            if not block[4]:
+                block[0] = block[1] = ts
+            block[0] = min(block[0], ts)
+            block[1] = max(block[1], ts)
+            block[3] += len(line)
+            block[4] += 1
+            add_record(self.stats, rec)
+        self.size += len(line)
+        return rec
+
+
+class Segment:
+    """Segmento arquivado (.ndjson.gz) e seu índice."""
+
+    def __init__(self, path: Path, blocks: List[Block], stats: Dict[str, Any], inode: Optional[int] = None) -> None:
+        self.path = path
+        self.blocks = blocks
+        self.stats = stats
+        self.inode = inode  # inode do segmento ativo que o originou
+
+    @property
+    def start(self) -> float:
+        return self.blocks[0][0] if self.blocks else 0.0
+
+    @property
+    def end(self) -> float:
+        return max((b[1] for b in self.blocks), default=0.0)
+
+    @classmethod
+    def load(cls, index_file: Path) -> "Segment":
+        meta = json.loads(index_file.read_text(encoding="utf-8"))
+        return cls(index_file.with_name(meta["file"]), meta["blocks"], meta["stats"], meta.get("inode"))
+
+    @property
+    def index_file(self) -> Path:
+        return self.path.with_name(self.path.name + INDEX_SUFFIX)
+
+    def summary_file(self, key: str) -> Path:
+        return self.path.with_name(self.path.name + SUMMARY_SUFFIX.format(key))
+
+    def summary(self, key: str) -> Any:
+        """Resumo `key` gravado no arquivamento, ou None se não houver."""
+        try:
+            return json.loads(self.summary_file(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Todos os registros, na ordem em que foram gravados."""
+        try:
+            f = self.path.open("rb")
+        except FileNotFoundError:  # removido pela retenção
+            return
+        with f:
+            for block in self.blocks:
+                f.seek(block[2])
+                for line in zlib.decompress(f.read(block[3]), 31).splitlines():
+                    rec = _parse(line)
+                    if rec is not None:
+                        yield rec
+
+    def delete(self) -> None:
+        summaries = self.path.parent.glob(self.path.name + SUMMARY_SUFFIX.format("*"))
+        for p in (self.index_file, *summaries, self.path):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _overlaps(block: Block, since: Optional[float], until: Optional[float]) -> bool:
+    return (since is None or block[1] >= since) and (until is None or block[0] <= until)
+
+
+def _read_lines(data: bytes, since: Optional[float], until: Optional[float]) -> Iterator[Dict[str, Any]]:
+    """Registros do bloco dentro de [since, until], do mais novo para o mais antigo."""
+    for line in reversed(data.splitlines()):
+        rec = _parse(line)
+        if rec is None:
+            continue
+        if (since is None or rec["ts"] >= since) and (until is None or rec["ts"] <= until):
+            yield rec
+
+
+class RequestLog:
+    """
+    A API só enfileira os registros (`submit`); uma thread própria os grava
+    em lotes (append/rotação/arquivamento), no mesmo esquema do
+    QueueListener do logging, mas sem montar um LogRecord por requisição.
+    Outra thread acompanha o segmento ativo, que recebe os registros de todos
+    os processos. Leituras vêm das requisições da API: um lock protege o
+    índice do segmento ativo e a lista de segmentos; a leitura dos blocos em
+    si acontece fora dele.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = SEGMENT_MAX_BYTES,
+        max_age_s: float = SEGMENT_MAX_AGE_S,
+        keep: int = KEEP_SEGMENTS,
+        summarize: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.keep = keep
+        self.summarize = summarize  # registros do segmento -> {chave: resumo}, gravados no arquivamento
+        self._lock = threading.Lock()       # índice do ativo, segmentos e retired
+        self._tail_lock = threading.Lock()  # uma leitura do segmento ativo por vez
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._tail_thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()  # a thread de escrita acabou de gravar um lote
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._active_path = self.directory / ACTIVE_NAME
+        # gravação (só a thread de escrita mexe nisso)
+        self._wfd: Optional[int] = None
+        self._first_ts: Optional[float] = None
+        # leitura
+        self.segments: List[Segment] = []
+        self.retired = new_stats()
+        self._tail_fd: Optional[int] = None
+        self._tail_ino: Optional[int] = None
+        self._active = _Index()
+        self._open_tail([], replay=False)
+        self.poll()
+
+    @contextmanager
+    def _locked(self, operation: int) -> Iterator[None]:
+        """flock no diretório: exclusivo para gravar/arquivar, compartilhado para listar."""
+        with open(self.directory / LOCK_NAME, "a+") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --------- escrita em segundo plano ---------
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+        self._thread.start()
+        self._tail_thread = threading.Thread(target=self._follow, name="request-log-tail", daemon=True)
+        self._tail_thread.start()
+
+    def submit(self, rec: Dict[str, Any]) -> None:
+        """Enfileira um registro (não bloqueia; chamado do event loop)."""
+        self._queue.put(rec)
+
+    def _run(self) -> None:
+        while True:
+            rec = self._queue.get()
+            lines: List[str] = []
+            while rec is not None:
+                lines.append(_encode(rec) + "\n")
+                if len(lines) >= WRITE_BATCH:
+                    break
+                try:
+                    rec = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if lines:
+                try:
+                    self._write("".join(lines).encode("utf-8"))
+                except Exception as e:
+                    logging.warning(f"Falha ao gravar o log de requisições: {e!r}")
+                self._wake.set()
+            if rec is None:
+                return
+
+    def stop(self) -> None:
+        """Grava o que estiver na fila, para o tail e fecha os arquivos."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._tail_thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._tail_thread.join()
+            self._tail_thread = None
+        self.close()
+
+    def append(self, rec: Dict[str, Any]) -> None:
+        """Grava um registro na hora (sem passar pela fila)."""
+        self._write((_encode(rec) + "\n").encode("utf-8"))
+
+    def _write(self, data: bytes) -> None:
+        with self._locked(fcntl.LOCK_EX):
+            fd = self._writer_fd()
+            size = os.fstat(fd).st_size
+            if size and (size + len(data) > self.max_bytes or time.time() - self._started_at(fd) >= self.max_age_s):
+                self._archive(fd)
+                fd = self._writer_fd()
+                size = 0
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                # um processo caiu no meio de uma linha: ela fica isolada e a leitura a ignora
+                data = b"\n" + data
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+
+    def _writer_fd(self) -> int:
+        """fd do segmento ativo atual (reabre se outro processo o arquivou)."""
+        if self._wfd is not None:
+            try:
+                if os.stat(self._active_path).st_ino == os.fstat(self._wfd).st_ino:
+                    return self._wfd
+            except FileNotFoundError:
+                pass
+            os.close(self._wfd)
+        self._wfd = os.open(self._active_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._first_ts = None
+        return self._wfd
+
+    def _started_at(self, fd: int) -> float:
+        """ts do primeiro registro do segmento ativo (base da rotação por idade)."""
+        if self._first_ts is None:
+            rec = _parse(os.pread(fd, 65536, 0).split(b"\n", 1)[0])
+            self._first_ts = rec["ts"] if rec is not None else time.time()
+        return self._first_ts
+
+    # --------- arquivamento ---------
+    def _archive(self, fd: int) -> None:
+        """
+        Comprime o segmento ativo bloco a bloco, grava o índice, remove o
+        ativo e aplica a retenção. Roda com o flock exclusivo.
+        """
+        st = os.fstat(fd)
+        data = os.pread(fd, st.st_size, 0)
+        index = _Index()
+        records = []
+        for line in data[:data.rfind(b"\n") + 1].splitlines(keepends=True):
+            rec = index.add(line)
+            if rec is not None:
+                records.append(rec)
+        if records:
+            start = index.blocks[0][0]
+            stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(start))
+            name = f"requests-{stamp}-{int(start * 1000) % 1000:03d}"
+            path = self.directory / f"{name}.ndjson.gz"
+            n = 1
+            while path.exists():
+                path = self.directory / f"{name}-{n}.ndjson.gz"
+                n += 1
+            blocks: List[Block] = []
+            with path.open("wb") as dst:
+                for start, end, offset, length, count in index.blocks:
+                    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = formato gzip
+                    chunk = compressor.compress(data[offset:offset + length]) + compressor.flush()
+                    blocks.append([start, end, dst.tell(), len(chunk), count])
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            segment = Segment(path, blocks, index.stats, st.st_ino)
+            if self.summarize is not None:
+                try:
+                    for key, summary in self.summarize(records).items():
+                        _write_json(segment.summary_file(key), summary)
+                except Exception as e:
+                    logging.warning(f"Falha ao resumir o segmento {path.name}: {e!r}")
+            # o índice por último: sem ele o segmento não existe para os leitores
+            _write_json(segment.index_file, {"file": path.name, "blocks": blocks, "stats": index.stats, "inode": st.st_ino})
+            logging.info(f"Log de requisições arquivado: {path.name} ({index.stats['count']} registros)")
+        self._active_path.unlink()
+        os.close(fd)
+        self._wfd = None
+        if self.keep:
+            self._retire()
+
+    def _retire(self) -> None:
+        """Apaga os segmentos mais antigos além de `keep`, somando seus agregados ao retired.json."""
+        index_files = sorted(self.directory.glob("*" + INDEX_SUFFIX))  # o nome começa pelo início do segmento
+        if len(index_files) <= self.keep:
+            return
+        retired_file = self.directory / RETIRED_NAME
+        retired = json.loads(retired_file.read_text(encoding="utf-8")) if retired_file.exists() else new_stats()
+        for index_file in index_files[:len(index_files) - self.keep]:
+            try:
+                oldest = Segment.load(index_file)
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Índice de log inválido ignorado ({index_file}): {e!r}")
+                continue
+            merge_stats(retired, oldest.stats)
+            _write_json(retired_file, retired)
+            oldest.delete()
+
+    def close(self) -> None:
+        with self._tail_lock, self._lock:
+            for fd in (self._wfd, self._tail_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._wfd = self._tail_fd = self._tail_ino = None
+
+    # --------- acompanhamento do segmento ativo ---------
+    def _follow(self) -> None:
+        # lê a cada POLL_INTERVAL (gravações dos outros processos) ou logo
+        # depois de um lote gravado por este
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            if self._stopping.is_set():
+                return
+            try:
+                self.poll()
+            except Exception as e:
+                logging.warning(f"Falha ao ler o log de requisições: {e!r}")
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """
+        Lê o que foi gravado (por qualquer processo) desde a última leitura e
+        atualiza o índice do segmento ativo. Numa rotação, termina o segmento
+        antigo, relê os que foram arquivados sem passar por este processo e
+        segue no novo. Devolve os registros novos, na ordem do log.
+        """
+        records: List[Dict[str, Any]] = []
+        with self._tail_lock:
+            if self._tail_fd is None:
+                self._open_tail(records)
+            else:
+                self._read_tail(records)
+                if self._rotated():
+                    self._read_tail(records)  # o que entrou antes do arquivamento
+                    self._open_tail(records, drained=self._tail_ino)
+            if self._tail_fd is not None:
+                self._read_tail(records)
+            if records:
+                for listener in self._listeners:
+                    try:
+                        listener(records)
+                    except Exception as e:
+                        logging.warning(f"Falha ao entregar registros do log de requisições: {e!r}")
+        return records
+
+    def follow(
+        self,
+        listener: Callable[[List[Dict[str, Any]]], None],
+        catch_up: Optional[Callable[["RequestLog"], Any]] = None,
+    ) -> None:
+        """
+        Passa a entregar a `listener` os registros novos de todos os
+        processos, em lotes e na ordem do log. `catch_up(self)` roda antes,
+        sem que nenhuma leitura aconteça no meio: o que ele vê por
+        `totals`/`iter_reverse` e o que chega depois ao `listener` não se
+        sobrepõem nem deixam buraco.
+        """
+        with self._tail_lock:
+            if catch_up is not None:
+                catch_up(self)
+            self._listeners.append(listener)
+
+    def _rotated(self) -> bool:
+        try:
+            return os.stat(self._active_path).st_ino != self._tail_ino
+        except FileNotFoundError:
+            return True
+
+    def _read_tail(self, records: List[Dict[str, Any]]) -> None:
+        fd = self._tail_fd
+        offset = self._active.size
+        data = os.pread(fd, max(os.fstat(fd).st_size - offset, 0), offset)
+        data = data[:data.rfind(b"\n") + 1]  # a última linha pode estar sendo gravada
+        if not data:
+            return
+        with self._lock:
+            for line in data.splitlines(keepends=True):
+                rec = self._active.add(line)
+                if rec is not None:
+                    records.append(rec)
+
+    def _open_tail(self, records: List[Dict[str, Any]], drained: Optional[int] = None, replay: bool = True) -> None:
+        """
+        Relê a lista de segmentos e abre o segmento ativo atual. Com `replay`,
+        os registros dos segmentos que este processo ainda não conhecia (fora
+        o que acabou de drenar, `drained`) entram em `records`.
+        """
+        known = {s.path.name: s for s in self.segments}
+        segments: List[Segment] = []
+        with self._locked(fcntl.LOCK_SH):
+            for index_file in self.directory.glob("*" + INDEX_SUFFIX):
+                name = index_file.name[:-len(INDEX_SUFFIX)]
+                if name in known:
+                    segments.append(known[name])
+                    continue
+                try:
+                    segments.append(Segment.load(index_file))
+                except (OSError, ValueError, KeyError) as e:
+                    logging.warning(f"Índice de log inválido ignorado ({index_file}): {e!r}")
+            retired_file = self.directory / RETIRED_NAME
+            retired = json.loads(retired_file.read_text(encoding="utf-8")) if retired_file.exists() else new_stats()
+            try:
+                fd: Optional[int] = os.open(self._active_path, os.O_RDONLY)
+            except FileNotFoundError:
+                fd = None
+            # lido ainda com o lock, antes que outro processo arquive os segmentos novos
+            if replay:
+                for segment in sorted(segments, key=lambda s: s.start):
+                    if segment.path.name not in known and segment.inode != drained:
+                        records.extend(segment.records())
+        segments.sort(key=lambda s: s.start)
+        with self._lock:
+            if self._tail_fd is not None:
+                os.close(self._tail_fd)
+            self._tail_fd = fd
+            self._tail_ino = os.fstat(fd).st_ino if fd is not None else None
+            self._active = _Index()
+            self.segments = segments
+            self.retired = retired
+
+    # --------- leitura ---------
+    def totals(self) -> Dict[str, Any]:
+        """Agregados de tudo o que já foi registrado (inclusive segmentos apagados)."""
+        with self._lock:
+            stats = new_stats()
+            merge_stats(stats, self.retired)
+            for segment in self.segments:
+                merge_stats(stats, segment.stats)
+            merge_stats(stats, self._active.stats)
+            return stats
+
+    def archived(self, since: Optional[float] = None) -> List[Segment]:
+        """Segmentos arquivados com registros a partir de `since`, do mais novo para o mais antigo."""
+        with self._lock:
+            return [s for s in reversed(self.segments) if since is None or s.end >= since]
+
+    def iter_reverse(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        active: bool = True,
+        archived: bool = True,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Registros com ts em [since, until] (epoch), do mais novo para o mais
+        antigo. Segmentos e blocos fora da janela não são lidos. `active` e
+        `archived` escolhem entre o segmento ativo e os arquivados.
+        """
+        with self._lock:
+            # o fd duplicado continua válido mesmo se o arquivo for rotacionado
+            fd = os.dup(self._tail_fd) if active and self._tail_fd is not None else None
+            active_blocks = [list(b) for b in self._active.blocks] if fd is not None else []
+            segments = list(self.segments) if archived else []
+        try:
+            for start, end, offset, length, count in reversed(active_blocks):
+                if _overlaps([start, end], since, until):
+                    yield from _read_lines(os.pread(fd, length, offset), since, until)
+        finally:
+            if fd is not None:
+                os.close(fd)
+        for segment in reversed(segments):
+            if not segment.blocks or not _overlaps([segment.start, segment.end], since, until):
+                continue
+            try:
+                f = segment.path.open("rb")
+            except FileNotFoundError:  # removido pela retenção durante a leitura
+                continue
+            with f:
+                for block in reversed(segment.blocks):
+                    if _overlaps(block, since, until):
+                        f.seek(block[2])
+                        yield from _read_lines(zlib.decompress(f.read(block[3]), 31), since, until)
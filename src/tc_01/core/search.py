@@ -0,0 +1,419 @@
+from __future__ import annotations
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Acima dessa fração de documentos alterados, reconstruir do zero sai mais barato
+REBUILD_RATIO = 0.25
+
+# Busca fuzzy: no máximo quantos candidatos verificar por consulta, quantos
+# postings ler para gerá-los e o tamanho do lote da verificação vetorizada
+FUZZY_MAX_CANDIDATES = 1024
+FUZZY_MAX_POSTINGS = 32768
+FUZZY_BATCH = 1024
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def trigrams(s: str) -> List[str]:
+    """'abcd' -> ['abc', 'bcd'] (sem repetição, ordem de aparição)."""
+    return list(dict.fromkeys(s[i:i + 3] for i in range(len(s) - 2)))
+
+
+class TrigramIndex:
+    """
+    Índice invertido de trigramas para busca "contains".
+
+    `docs` são as strings já normalizadas (minúsculas); cada trigrama aponta para
+    um array ordenado com as posições dos documentos que o contêm. A busca
+    intersecta as listas dos trigramas da consulta e verifica os candidatos
+    com `in`, então a semântica é exatamente a de `needle in doc`.
+    """
+
+    def __init__(self, docs: Sequence[str], postings: Mapping[str, np.ndarray]) -> None:
+        self.docs = docs
+        self.postings = postings
+        self._bitmaps: Dict[str, np.ndarray] = {}  # trigrama -> bitmap dos documentos (fuzzy)
+
+    # --------- construção ---------
+    @classmethod
+    def build(cls, docs: Sequence[str], previous: Optional["TrigramIndex"] = None) -> "TrigramIndex":
+        """
+        Monta o índice. Com `previous` (índice da versão anterior do dataset),
+        só os documentos que mudaram são reindexados.
+        """
+        if previous is not None:
+            old = previous.docs
+            changed = [i for i, (a, b) in enumerate(zip(old, docs)) if a != b]
+            changed.extend(range(min(len(old), len(docs)), max(len(old), len(docs))))
+            if len(changed) <= REBUILD_RATIO * max(len(docs), 1):
+                return cls._patch(previous, docs, changed)
+        return cls._full(docs)
+
+    @classmethod
+    def _full(cls, docs: Sequence[str]) -> "TrigramIndex":
+        gram_ids: Dict[str, int] = {}
+        pair_gram: List[int] = []
+        pair_doc: List[int] = []
+        for d, s in enumerate(docs):
+            for g in trigrams(s):
+                gid = gram_ids.get(g)
+                if gid is None:
+                    gid = gram_ids[g] = len(gram_ids)
+                pair_gram.append(gid)
+                pair_doc.append(d)
+        g_arr = np.asarray(pair_gram, dtype=np.int64)
+        d_arr = np.asarray(pair_doc, dtype=np.int64)
+        # agrupa por trigrama; o sort estável mantém os documentos em ordem crescente
+        order = np.argsort(g_arr, kind="stable")
+        bounds = np.cumsum(np.bincount(g_arr, minlength=len(gram_ids)))
+        chunks = np.split(d_arr[order], bounds[:-1]) if gram_ids else []
+        return cls(docs, dict(zip(gram_ids, chunks)))
+
+    @classmethod
+    def _patch(cls, previous: "TrigramIndex", docs: Sequence[str], changed: List[int]) -> "TrigramIndex":
+        removed: Dict[str, List[int]] = defaultdict(list)
+        added: Dict[str, List[int]] = defaultdict(list)
+        for i in changed:
+            if i < len(previous.docs):
+                for g in trigrams(previous.docs[i]):
+                    removed[g].append(i)
+            if i < len(docs):
+                for g in trigrams(docs[i]):
+                    added[g].append(i)
+        # cópia rasa: os arrays da versão anterior nunca são alterados
+        postings = dict(previous.postings)
+        for g in set(removed) | set(added):
+            arr = postings.get(g, _EMPTY)
+            if g in removed:
+                arr = np.setdiff1d(arr, removed[g], assume_unique=True)
+            if g in added:
+                arr = np.union1d(arr, added[g])
+            if arr.size:
+                postings[g] = arr
+            else:
+                postings.pop(g, None)
+        return cls(docs, postings)
+
+    # --------- consulta ---------
+    def search(self, needle: str) -> np.ndarray:
+        """Posições (crescentes) dos documentos que contêm `needle`."""
+        docs = self.docs
+        grams = trigrams(needle)
+        if not grams:
+            # consulta curta demais para o índice: varredura simples
+            return np.asarray([i for i, d in enumerate(docs) if needle in d], dtype=np.int64)
+        lists = []
+        for g in grams:
+            posting = self.postings.get(g)
+            if posting is None:
+                return _EMPTY
+            lists.append(posting)
+        lists.sort(key=len)
+        cand = lists[0]
+        for posting in lists[1:]:
+            cand = np.intersect1d(cand, posting, assume_unique=True)
+            if not cand.size:
+                return _EMPTY
+        if len(grams) == 1 and len(needle) == 3:
+            return cand
+        return np.asarray([i for i in cand.tolist() if needle in docs[i]], dtype=np.int64)
+
+    def fuzzy(self, query: str, max_dist: int = 2, k: int = 10) -> List[Tuple[int, int]]:
+        """
+        Busca tolerante a erros de digitação: documentos que contêm um trecho a
+        no máximo `max_dist` edições de `query`. Retorna até `k` pares
+        (doc, distância), do mais próximo para o mais distante.
+
+        Filtro de q-gramas: cada edição destrói no máximo 3 trigramas, então um
+        documento precisa ter ao menos t = (trigramas da consulta - 3*max_dist)
+        deles para ser candidato -- e, portanto, ao menos um dos (U - t + 1)
+        trigramas mais raros. Só as listas desses geram candidatos; as demais
+        apenas completam a contagem. Os candidatos são verificados em lotes
+        (Myers vetorizado), em ordem decrescente de trigramas em comum, parando
+        quando o limite inferior de distância já não pode melhorar o top-k.
+
+        Consultas pouco seletivas (trigramas muito comuns, consulta curta num
+        catálogo grande) são limitadas: lê-se no máximo FUZZY_MAX_POSTINGS
+        postings para gerar candidatos e verificam-se os FUZZY_MAX_CANDIDATES
+        com mais trigramas em comum. Abaixo desses limites o resultado é exato.
+        """
+        grams = trigrams(query)
+        threshold = len(grams) - 3 * max_dist
+        if not grams or (threshold <= 0 and len(self.docs) <= FUZZY_MAX_CANDIDATES):
+            # consulta curta demais para filtrar: varre em ordem de documento,
+            # até ter k a distância 0 (nenhum documento seguinte os supera)
+            order = np.arange(len(self.docs), dtype=np.int64)
+            bounds = None
+        else:
+            threshold = max(threshold, 1)
+            lists = sorted(((g, self.postings.get(g, _EMPTY)) for g in grams), key=lambda x: len(x[1]))
+            prefix, read = 0, 0
+            while prefix < len(grams) - threshold + 1 and (
+                prefix == 0 or read + len(lists[prefix][1]) <= FUZZY_MAX_POSTINGS
+            ):
+                read += len(lists[prefix][1])
+                prefix += 1
+            cand, counts = np.unique(np.concatenate([p for _, p in lists[:prefix]] or [_EMPTY]), return_counts=True)
+            # poda antes das listas maiores: fica fora quem nem com todas as
+            # restantes chega ao limiar ou ao FUZZY_MAX_CANDIDATES-ésimo contador
+            floor = threshold
+            if len(cand) > FUZZY_MAX_CANDIDATES:
+                above = np.cumsum(np.bincount(counts)[::-1])  # quantos têm contador >= c
+                floor = max(floor, len(above) - 1 - int(np.searchsorted(above, FUZZY_MAX_CANDIDATES)))
+            remaining = len(lists) - prefix
+            for gram, posting in lists[prefix:]:
+                if floor > remaining + 1:  # todo candidato tem contador >= 1
+                    keep = counts + remaining >= floor
+                    cand, counts = cand[keep], counts[keep]
+                    if not cand.size:
+                        break
+                counts += self._contains(gram, posting, cand)
+                remaining -= 1
+            keep = counts >= threshold
+            cand, counts = cand[keep], counts[keep]
+            sort = np.lexsort((cand, -counts))[:FUZZY_MAX_CANDIDATES]
+            order = cand[sort]
+            bounds = -(-(len(grams) - counts[sort]) // 3)  # ceil((U - c) / 3)
+
+        best: List[Tuple[int, int]] = []  # heap de (-dist, -doc): o pior no topo
+        docs = self.docs
+        for start in range(0, len(order), FUZZY_BATCH):
+            if len(best) == k and (-best[0][0] == 0 if bounds is None else bounds[start] > -best[0][0]):
+                break
+            batch = order[start:start + FUZZY_BATCH]
+            dists = _myers_many(query, list(map(docs.__getitem__, batch.tolist())))
+            hits = dists <= max_dist
+            for doc, dist in zip(batch[hits].tolist(), dists[hits].tolist()):
+                item = (-dist, -doc)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        return sorted(((-neg_doc, -neg_dist) for neg_dist, neg_doc in best), key=lambda x: (x[1], x[0]))
+
+    def _contains(self, gram: str, posting: np.ndarray, cand: np.ndarray) -> np.ndarray:
+        """Quais de `cand` (ordenados) estão em `posting`, como array booleano."""
+        if len(posting) * posting.itemsize * 8 < len(self.docs):
+            pos = np.minimum(np.searchsorted(posting, cand), max(len(posting) - 1, 0))
+            return posting[pos] == cand if posting.size else np.zeros(len(cand), dtype=bool)
+        # lista longa: um bit por documento não ocupa mais que a própria lista e
+        # troca a busca binária por um acesso direto
+        bitmap = self._bitmaps.get(gram)
+        if bitmap is None:
+            mask = np.zeros(len(self.docs), dtype=bool)
+            mask[posting] = True
+            bitmap = self._bitmaps[gram] = np.packbits(mask, bitorder="little")
+        return ((bitmap[cand >> 3] >> (cand & 7).astype(np.uint8)) & 1).astype(bool)
+
+
+def _pattern_masks(pattern: str) -> Dict[str, int]:
+    """Bitmask de posições de cada caractere no padrão (para o algoritmo de Myers)."""
+    peq: Dict[str, int] = defaultdict(int)
+    for i, ch in enumerate(pattern):
+        peq[ch] |= 1 << i
+    return dict(peq)
+
+
+def _myers(peq: Dict[str, int], m: int, text: str, max_dist: int) -> Optional[int]:
+    """
+    Versão bit-paralela (Myers, 1999) de Sellers: cada caractere do texto
+    atualiza a coluna inteira da matriz de edição com operações sobre inteiros.
+    Bits acima de m nunca influenciam os de baixo (o "vai-um" só sobe), então
+    dispensamos as máscaras e olhamos apenas o bit m-1.
+    """
+    if m == 0:
+        return 0
+    high = 1 << (m - 1)
+    pv, mv, score = (1 << m) - 1, 0, m
+    best = m
+    get = peq.get
+    for ch in text:
+        eq = get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+            if score < best:
+                best = score
+                if best == 0:
+                    return 0
+        ph <<= 1
+        pv = (mh << 1) | ~(xv | ph)
+        mv = ph & xv
+    return best if best <= max_dist else None
+
+
+def substring_distance(pattern: str, text: str, max_dist: int) -> Optional[int]:
+    """
+    Menor distância de edição entre `pattern` e algum trecho de `text`,
+    ou None se for maior que `max_dist`.
+    """
+    return _myers(_pattern_masks(pattern), len(pattern), text, max_dist)
+
+
+def _myers_many(pattern: str, texts: Sequence[str]) -> np.ndarray:
+    """
+    _myers para vários textos de uma vez, com a matriz transposta: os bits
+    percorrem as posições do texto (palavras de 64 bits, com vai-um entre
+    elas) e o laço anda pelos caracteres do padrão. São len(pattern) passos de
+    operações numpy sobre o lote inteiro, em vez de um por caractere do texto
+    mais longo. A linha 0 é livre (o trecho começa em qualquer posição) e a
+    coluna 0 vale i, daí o 1 que entra no deslocamento de Ph. Devolve a menor
+    distância de cada texto (sem limite).
+    """
+    m, n = len(pattern), len(texts)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    need = np.maximum(-(-lengths // 64), 1)
+    words = int(need.max(initial=1))
+    # textos completados até 64*words com um código fora do padrão: o
+    # preenchimento nunca melhora a distância, então não precisa ser mascarado
+    chars = np.full((n, 64 * words), 0x110000, dtype=np.uint32)
+    chars[np.arange(64 * words) < lengths[:, None]] = np.frombuffer(
+        "".join(texts).encode("utf-32-le"), dtype=np.uint32
+    )
+
+    def bits(mask: np.ndarray) -> np.ndarray:
+        # (n, 64*words) booleano -> (words, n) uint64, bit t = posição t
+        return np.packbits(mask, axis=1, bitorder="little").view("<u8").T.copy()
+
+    eqs = {ch: bits(chars == ord(ch)) for ch in set(pattern)}
+    one, top = np.uint64(1), np.uint64(63)
+    pv = np.zeros((words, n), dtype=np.uint64)
+    mv = np.zeros((words, n), dtype=np.uint64)
+    for ch in pattern:
+        eq = eqs[ch]
+        xv = eq | mv
+        xh = eq & pv
+        xh += pv
+        carry = xh < pv
+        for w in range(1, words):  # vai-um da soma entre as palavras
+            xh[w] += carry[w - 1]
+            carry[w] |= carry[w - 1] & (xh[w] == 0)
+        xh ^= pv
+        xh |= eq
+        ph = xh | pv
+        np.invert(ph, out=ph)
+        ph |= mv
+        mh = pv & xh
+        hi_ph, hi_mh = ph >> top, mh >> top
+        ph <<= one
+        ph[1:] |= hi_ph[:-1]
+        ph[0] |= one
+        mh <<= one
+        mh[1:] |= hi_mh[:-1]
+        np.bitwise_and(ph, xv, out=mv)
+        xv |= ph
+        np.invert(xv, out=pv)
+        pv |= mh
+
+    # D[m][j] = m + soma dos deltas horizontais até j. Os bits são somados de
+    # byte em byte: para cada par (byte de Pv, byte de Mv), a tabela dá o total
+    # do byte e o menor prefixo dentro dele.
+    keys = (pv.view(np.uint8).astype(np.intp) << 8) | mv.view(np.uint8)
+    keys = keys.reshape(words, n, 8).transpose(0, 2, 1).reshape(8 * words, n)
+    net, low = _BYTE_NET[keys], _BYTE_LOW[keys]
+    before = np.cumsum(net, axis=0) - net
+    return m + np.minimum((before + low).min(axis=0, initial=0), 0)
+
+
+def _byte_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Para cada chave (p << 8) | m: soma de (bit de p - bit de m) e menor soma parcial."""
+    keys = np.arange(1 << 16)
+    p = np.unpackbits((keys >> 8).astype(np.uint8)[:, None], axis=1, bitorder="little")
+    m = np.unpackbits((keys & 0xFF).astype(np.uint8)[:, None], axis=1, bitorder="little")
+    prefix = np.cumsum(p.astype(np.int64) - m, axis=1)
+    return prefix[:, -1], prefix.min(axis=1)
+
+
+_BYTE_NET, _BYTE_LOW = _byte_tables()
+
+
+# ================= Full-text (BM25) =================
+
+# Variantes tipográficas que aparecem no CSV ("Noah’s" vs "Noah's")
+_PUNCT_FOLD = str.maketrans({"\u2019": "'", "\u2018": "'", "\u201c": '"', "\u201d": '"',
+                             "\u2013": "-", "\u2014": "-"})
+_token_rx = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Normaliza para busca: 'Café Noah’s' -> "cafe noah's" (sem acentos, casefold)."""
+    text = unicodedata.normalize("NFKD", text.translate(_PUNCT_FOLD))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return _token_rx.findall(fold(text))
+
+
+class BM25Index:
+    """
+    Índice invertido tokenizado com ranking BM25.
+
+    Para cada termo guarda os documentos e a frequência do termo em cada um.
+    A consulta só visita as listas dos seus termos e usa um heap para o top-k,
+    sem pontuar nem ordenar o catálogo inteiro.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, doc_len: np.ndarray, postings: Mapping[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        self.doc_len = doc_len
+        self.avg_len = float(doc_len.mean()) if doc_len.size else 0.0
+        self.postings = postings
+
+    @classmethod
+    def build(cls, docs: Sequence[str]) -> "BM25Index":
+        acc: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        lengths: List[int] = []
+        for d, text in enumerate(docs):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                ds, tfs = acc[term]
+                ds.append(d)
+                tfs.append(tf)
+        postings = {
+            term: (np.asarray(ds, dtype=np.int64), np.asarray(tfs, dtype=np.float64))
+            for term, (ds, tfs) in acc.items()
+        }
+        return cls(np.asarray(lengths, dtype=np.float64), postings)
+
+    def idf(self, df: int) -> float:
+        n = len(self.doc_len)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 20) -> Tuple[int, List[Tuple[int, float]]]:
+        """
+        Retorna (total de documentos com algum termo, [(doc, score), ...]) com
+        os `k` melhores em ordem decrescente de score (empate: menor doc primeiro).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        docs_parts: List[np.ndarray] = []
+        score_parts: List[np.ndarray] = []
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ds, tfs = posting
+            norm = self.K1 * (1.0 - self.B + self.B * self.doc_len[ds] / self.avg_len)
+            docs_parts.append(ds)
+            score_parts.append(self.idf(len(ds)) * tfs * (self.K1 + 1.0) / (tfs + norm))
+        if not docs_parts:
+            return 0, []
+        cand, inv = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        scores = np.bincount(inv.reshape(-1), weights=np.concatenate(score_parts), minlength=len(cand))
+        top = heapq.nlargest(k, zip(scores.tolist(), (-d for d in cand.tolist())))
+        return len(cand), [(-neg_doc, score) for score, neg_doc in top]
@@ -1,8 +1,12 @@
 from __future__ import annotations
+import hashlib
 import os
+import threading
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Callable
+from typing import Any, Dict, List, Optional, Callable, Tuple
 
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -12,6 +16,9 @@ SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")   # em prod: variá
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MIN = int(os.getenv("ACCESS_TOKEN_EXPIRE_MIN", "15"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Cache de tokens já verificados: quantos guardar e por quanto tempo (s), no máximo
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
 
 # Autenticação via header Authorization: Bearer <token>
 security = HTTPBearer(auto_error=True)
@@ -48,15 +55,80 @@ def decode_token(token: str) -> dict:
         raise HTTPException(status_code=401, detail=f"Token inválido: {e.__class__.__name__}")
 
 
+class TokenCache:
+    """
+    LRU de claims de tokens já verificados, chaveado pelo digest do token (o
+    token em si não fica em memória). Cada entrada vale até o `exp` do token
+    ou por `ttl` segundos, o que vier antes. Só tokens válidos entram: os
+    inválidos sempre passam por decode_token.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        expires_at = min(float(claims.get("exp", 0)), time.time() + self.ttl)
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+TOKEN_CACHE = TokenCache()
+
+
 def auth_required(cred: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     """
     Dep de segurança para rotas protegidas por access token.
     - Lê Authorization: Bearer <token>
-    - Valida assinatura/expiração e 'type' == 'access'
+    - Valida assinatura/expiração e 'type' == 'access' (tokens já vistos
+      vêm do TOKEN_CACHE, sem verificar a assinatura de novo)
     - Retorna os 'claims' (sub, roles, etc.)
     """
     token = cred.credentials
-    payload = decode_token(token)
+    payload = TOKEN_CACHE.get(token)
+    if payload is None:
+        payload = decode_token(token)
+        TOKEN_CACHE.put(token, payload)
     if payload.get("type") != "access":
         raise HTTPException(status_code=401, detail="Use um access token válido")
     return payload
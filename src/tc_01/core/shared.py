@@ -0,0 +1,314 @@
+from __future__ import annotations
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from tc_01.core.search import BM25Index, TrigramIndex
+from tc_01.core.snapshot import (
+    META_COLUMNS,
+    NUMERIC_COLUMNS,
+    SnapshotError,
+    decode_text,
+    encode_text,
+    read_arrays,
+    source_stamp,
+    write_arrays,
+)
+from tc_01.core.store import NO_ID, BookStore
+
+# Catálogo compartilhado entre workers do uvicorn.
+#
+# Um worker (o que pegar o lock) monta o BookStore completo e o exporta, com
+# todos os índices, como arrays planos num arquivo de segmento. Todos os
+# workers -- inclusive ele -- só fazem memmap somente-leitura desse arquivo,
+# então as páginas ficam no page cache do SO uma única vez e a memória
+# residente de cada processo não cresce com o número de workers.
+#
+# Diretório:
+#   CURRENT            versão publicada (contador monotônico)
+#   catalog-<v>.seg    segmento da versão v
+#   lock               flock para eleger quem reconstrói
+
+_CURRENT = "CURRENT"
+_LOCK = "lock"
+
+# Tabela direta id -> linha só quando os ids são densos
+_DENSE_FACTOR = 4
+
+
+class TextColumn(Sequence):
+    """
+    Coluna de texto sobre um blob UTF-8 (strings separadas por NUL) + offsets.
+    Acesso por posição decodifica só aquela string; iterar decodifica o blob todo.
+    """
+
+    def __init__(self, blob: np.ndarray, starts: np.ndarray, none_if_empty: bool = False) -> None:
+        self.blob = blob
+        self.starts = starts
+        self.none_if_empty = none_if_empty
+
+    def __len__(self) -> int:
+        return len(self.starts) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        # starts[i+1] - 1 descarta o NUL separador
+        v = self.blob[self.starts[i]:self.starts[i + 1] - 1].tobytes().decode("utf-8")
+        return (v or None) if self.none_if_empty else v
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        values = decode_text(self.blob, len(self))
+        if self.none_if_empty:
+            return (v or None for v in values)
+        return iter(values)
+
+    @staticmethod
+    def encode(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(blob, starts) de uma lista de strings."""
+        blob = encode_text(values)
+        lengths = np.fromiter((len((v or "").encode("utf-8")) + 1 for v in values), dtype=np.int64, count=len(values))
+        starts = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=starts[1:])
+        return blob, starts
+
+
+class CSRPostings(Mapping):
+    """
+    Listas invertidas em formato CSR: termos ordenados (array de strings),
+    offsets e um ou mais arrays de valores. Consulta por busca binária.
+    """
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, *columns: np.ndarray) -> None:
+        self.terms = terms
+        self.offsets = offsets
+        self.columns = columns
+
+    def _slot(self, key: str) -> int:
+        i = int(np.searchsorted(self.terms, key))
+        if i < len(self.terms) and self.terms[i] == key:
+            return i
+        return -1
+
+    def __getitem__(self, key: str) -> Union[np.ndarray, Tuple[np.ndarray, ...]]:
+        i = self._slot(key)
+        if i < 0:
+            raise KeyError(key)
+        a, b = self.offsets[i], self.offsets[i + 1]
+        if len(self.columns) == 1:
+            return self.columns[0][a:b]
+        return tuple(v[a:b] for v in self.columns)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._slot(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms.tolist())
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @staticmethod
+    def encode(postings: Mapping[str, Any], dtypes: Sequence[Any]) -> List[np.ndarray]:
+        """[keys, offsets, *values] a partir de um dict termo -> array (ou tupla de arrays)."""
+        keys = sorted(postings)
+        parts: List[List[np.ndarray]] = [[] for _ in dtypes]
+        lengths = []
+        for k in keys:
+            v = postings[k]
+            v = v if isinstance(v, tuple) else (v,)
+            lengths.append(len(v[0]))
+            for j, arr in enumerate(v):
+                parts[j].append(arr)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        width = max((len(k) for k in keys), default=1)
+        out = [np.asarray(keys, dtype=f"<U{width}"), offsets]
+        for j, dtype in enumerate(dtypes):
+            out.append(np.concatenate(parts[j]).astype(dtype) if keys else np.empty(0, dtype=dtype))
+        return out
+
+
+class ArrayIdIndex:
+    """id -> linha em array: tabela direta se os ids forem densos, senão busca binária."""
+
+    def __init__(self, table: np.ndarray, keys: np.ndarray, rows: np.ndarray) -> None:
+        self.table = table
+        self.keys = keys
+        self.rows = rows
+
+    def get(self, book_id: int, default: Optional[int] = None) -> Optional[int]:
+        if self.table.size:
+            if 0 <= book_id < len(self.table):
+                row = int(self.table[book_id])
+                if row >= 0:
+                    return row
+            return default
+        i = int(np.searchsorted(self.keys, book_id))
+        if i < len(self.keys) and self.keys[i] == book_id:
+            return int(self.rows[i])
+        return default
+
+    @staticmethod
+    def encode(id_index: Mapping[int, int], rows: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        keys = np.fromiter(id_index.keys(), dtype=np.int64, count=len(id_index))
+        vals = np.fromiter(id_index.values(), dtype=np.int64, count=len(id_index))
+        empty = np.empty(0, dtype=np.int64)
+        if keys.size and keys.min() >= 0 and keys.max() < _DENSE_FACTOR * rows + 1024:
+            table = np.full(int(keys.max()) + 1, NO_ID, dtype=np.int64)
+            table[keys] = vals
+            return table, empty, empty
+        order = np.argsort(keys)
+        return empty, keys[order], vals[order]
+
+
+def _sort_name(key: Tuple[Tuple[str, bool], ...]) -> str:
+    return "_".join(f"{f}_{'asc' if asc else 'desc'}" for f, asc in key)
+
+
+def export_store(store: BookStore, path: Path, meta: Dict[str, Any]) -> None:
+    """Grava o catálogo e todos os índices de `store` como arrays em `path`."""
+    idx = store.indexes()
+    arrays: Dict[str, np.ndarray] = {name: getattr(store, name) for name in NUMERIC_COLUMNS}
+    arrays["titles"], arrays["titles_starts"] = TextColumn.encode(store.titles)
+    arrays["images"], arrays["images_starts"] = TextColumn.encode(store.images)
+
+    id_index = idx["id_index"]
+    if isinstance(id_index, ArrayIdIndex):
+        arrays["id_table"], arrays["id_keys"], arrays["id_rows"] = id_index.table, id_index.keys, id_index.rows
+    else:
+        arrays["id_table"], arrays["id_keys"], arrays["id_rows"] = ArrayIdIndex.encode(id_index, len(store))
+
+    arrays["title_rank"] = idx["title_rank"]
+    sort_keys = [key for key in idx["sort_perms"] if key]
+    for key in sort_keys:
+        perm, rank = idx["sort_perms"][key]
+        arrays[f"perm_{_sort_name(key)}"] = perm
+        arrays[f"rank_{_sort_name(key)}"] = rank
+
+    title_index: TrigramIndex = idx["title_index"]
+    arrays["title_docs"], arrays["title_docs_starts"] = TextColumn.encode(title_index.docs)
+    (arrays["tri_keys"], arrays["tri_offsets"], arrays["tri_docs"]) = CSRPostings.encode(
+        title_index.postings, [np.int64]
+    )
+
+    fulltext: BM25Index = idx["fulltext"]
+    arrays["bm25_doc_len"] = fulltext.doc_len
+    (arrays["bm25_keys"], arrays["bm25_offsets"], arrays["bm25_docs"], arrays["bm25_tfs"]) = CSRPostings.encode(
+        fulltext.postings, [np.int64, np.float64]
+    )
+
+    meta = {
+        **meta,
+        "rows": len(store),
+        "sort_keys": [[list(k) for k in key] for key in sort_keys],
+        **{name: list(getattr(store, name)) for name in META_COLUMNS},
+    }
+    write_arrays(path, arrays, meta)
+
+
+def attach_store(path: Path) -> Tuple[BookStore, Dict[str, Any]]:
+    """Abre um segmento por memmap e monta o BookStore sem recalcular nada."""
+    a, meta = read_arrays(path, verify=False)
+    columns: Dict[str, Any] = {name: a[name] for name in NUMERIC_COLUMNS}
+    columns["titles"] = TextColumn(a["titles"], a["titles_starts"])
+    columns["images"] = TextColumn(a["images"], a["images_starts"], none_if_empty=True)
+    for name in META_COLUMNS:
+        columns[name] = meta[name]
+
+    identity = np.arange(meta["rows"], dtype=np.int64)
+    sort_perms: Dict[Any, Tuple[np.ndarray, np.ndarray]] = {(): (identity, identity)}
+    for key in meta["sort_keys"]:
+        key = tuple((f, bool(asc)) for f, asc in key)
+        sort_perms[key] = (a[f"perm_{_sort_name(key)}"], a[f"rank_{_sort_name(key)}"])
+
+    indexes = {
+        "id_index": ArrayIdIndex(a["id_table"], a["id_keys"], a["id_rows"]),
+        "title_rank": a["title_rank"],
+        "sort_perms": sort_perms,
+        "title_index": TrigramIndex(
+            TextColumn(a["title_docs"], a["title_docs_starts"]),
+            CSRPostings(a["tri_keys"], a["tri_offsets"], a["tri_docs"]),
+        ),
+        "fulltext": BM25Index(
+            a["bm25_doc_len"],
+            CSRPostings(a["bm25_keys"], a["bm25_offsets"], a["bm25_docs"], a["bm25_tfs"]),
+        ),
+    }
+    store = BookStore(**columns, version=meta["version"], indexes=indexes)
+    return store, meta
+
+
+class SharedCatalog:
+    """
+    Coordena o segmento compartilhado em `directory` para o CSV `source`.
+    """
+
+    def __init__(self, directory: Path, source: Path) -> None:
+        self.directory = Path(directory)
+        self.source = Path(source)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _segment(self, version: int) -> Path:
+        return self.directory / f"catalog-{version:08d}.seg"
+
+    @contextmanager
+    def _locked(self):
+        with open(self.directory / _LOCK, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def current_version(self) -> int:
+        """Versão publicada (0 se nenhuma). Leitura barata, feita a cada poll."""
+        try:
+            return int((self.directory / _CURRENT).read_text().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _publish(self, store: BookStore, stamp: Dict[str, int]) -> int:
+        version = self.current_version() + 1
+        export_store(store, self._segment(version), {"version": version, "source": stamp})
+        tmp = self.directory / f"{_CURRENT}.tmp"
+        tmp.write_text(str(version))
+        os.replace(tmp, self.directory / _CURRENT)
+        # versões antigas: quem ainda as mapeia continua lendo (unlink não invalida o mmap)
+        for seg in self.directory.glob("catalog-*.seg"):
+            if seg.name < self._segment(version - 1).name:
+                seg.unlink(missing_ok=True)
+        return version
+
+    def acquire(
+        self,
+        build: Callable[[Optional[BookStore]], BookStore],
+        previous: Optional[BookStore] = None,
+        force: bool = False,
+    ) -> BookStore:
+        """
+        Devolve o catálogo publicado para o CSV atual, anexando-o por memmap.
+        Se não houver segmento para ele (ou com `force`), este processo o
+        constrói com `build(previous)` e publica uma versão nova.
+        """
+        with self._locked():
+            stamp = source_stamp(self.source)
+            version = self.current_version()
+            if version and not force:
+                try:
+                    store, meta = attach_store(self._segment(version))
+                    if meta["source"] == stamp:
+                        return store
+                except (SnapshotError, KeyError) as e:
+                    logging.warning(f"Segmento compartilhado v{version} inválido: {e!r}")
+            version = self._publish(build(previous), stamp)
+        store, _ = attach_store(self._segment(version))
+        logging.info(f"Catálogo compartilhado publicado: versão {version} ({len(store)} livros)")
+        return store
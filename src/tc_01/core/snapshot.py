@@ -0,0 +1,158 @@
+from __future__ import annotations
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Formato dos arquivos binários (snapshot do catálogo e segmento compartilhado):
+#   [magic 8B][schema u32][tamanho do header u32][header JSON][pad]
+#   [arrays, cada um alinhado em 64 bytes]
+# Os arrays são lidos por memmap, sem cópia nem parsing. O header guarda
+# offsets, dtypes e shapes, o CRC32 da área de dados e metadados livres.
+MAGIC = b"TC1SNAP\x00"
+SCHEMA_VERSION = 2
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 64
+
+# Colunas do snapshot do catálogo
+NUMERIC_COLUMNS = {
+    "ids": "<i8",
+    "prices": "<f8",
+    "ratings": "i1",
+    "in_stock": "?",
+    "stock_qty": "<i4",
+    "availability_codes": "<i4",
+    "category_codes": "<i4",
+}
+TEXT_COLUMNS = ("titles", "images")
+META_COLUMNS = ("availability_values", "categories")
+
+_SEP = "\x00"
+
+
+class SnapshotError(Exception):
+    """Snapshot ausente, corrompido, de outro schema ou desatualizado."""
+
+
+def snapshot_path(csv_path: Path) -> Path:
+    """books_data.csv -> books_data.bin"""
+    return Path(csv_path).with_suffix(".bin")
+
+
+def source_stamp(source: Path) -> Dict[str, int]:
+    st = os.stat(source)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+def encode_text(values: Sequence[Optional[str]]) -> np.ndarray:
+    """Lista de strings -> bytes UTF-8 separados por NUL (None vira "")."""
+    values = [v or "" for v in values]
+    if any(_SEP in v for v in values):
+        raise ValueError("Texto contém NUL")
+    return np.frombuffer(_SEP.join(values).encode("utf-8"), dtype=np.uint8)
+
+
+def decode_text(raw: np.ndarray, rows: int) -> List[str]:
+    return raw.tobytes().decode("utf-8").split(_SEP) if rows else []
+
+
+def write_arrays(path: Path, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> None:
+    """Grava `arrays` + `meta` no formato acima (via arquivo temporário)."""
+    blocks = [(name, np.ascontiguousarray(arr)) for name, arr in arrays.items()]
+    layout: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    crc = 0
+    for name, arr in blocks:
+        data = arr.reshape(-1).view(np.uint8)
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset, "nbytes": arr.nbytes}
+        crc = zlib.crc32(data, crc)
+        crc = zlib.crc32(bytes(_pad(arr.nbytes)), crc)
+        offset += arr.nbytes + _pad(arr.nbytes)
+
+    header = {"arrays": layout, "crc32": crc, "meta": meta}
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, "wb") as f:
+        head = _PREFIX.pack(MAGIC, SCHEMA_VERSION, len(header_bytes)) + header_bytes
+        f.write(head + bytes(_pad(len(head))))
+        for _, arr in blocks:
+            f.write(arr.reshape(-1).view(np.uint8).data)
+            f.write(bytes(_pad(arr.nbytes)))
+    os.replace(tmp, path)
+
+
+def read_arrays(path: Path, verify: bool = True) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    Abre o arquivo por memmap e devolve (arrays somente-leitura, meta).
+    Com `verify`, confere o CRC32 da área de dados.
+    """
+    try:
+        mm = np.memmap(path, dtype=np.uint8, mode="r")
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"não foi possível abrir: {e}") from e
+    if len(mm) < _PREFIX.size:
+        raise SnapshotError("arquivo truncado")
+    magic, schema, header_len = _PREFIX.unpack(mm[:_PREFIX.size].tobytes())
+    if magic != MAGIC:
+        raise SnapshotError("magic inválido")
+    if schema != SCHEMA_VERSION:
+        raise SnapshotError(f"schema {schema} (esperado {SCHEMA_VERSION})")
+    try:
+        header = json.loads(mm[_PREFIX.size:_PREFIX.size + header_len].tobytes().decode("utf-8"))
+    except ValueError as e:
+        raise SnapshotError(f"header inválido: {e}") from e
+
+    start = _PREFIX.size + header_len
+    data = mm[start + _pad(start):]
+    if verify and zlib.crc32(data) != header["crc32"]:
+        raise SnapshotError("checksum não confere")
+
+    arrays: Dict[str, np.ndarray] = {}
+    for name, spec in header["arrays"].items():
+        raw = data[spec["offset"]:spec["offset"] + spec["nbytes"]]
+        arrays[name] = np.asarray(raw.view(spec["dtype"])).reshape(spec["shape"])
+    return arrays, header["meta"]
+
+
+# --------- snapshot do catálogo ---------
+def write_snapshot(path: Path, columns: Dict[str, Any], source: Optional[Path] = None) -> None:
+    """
+    Grava as colunas de `records_to_columns` em `path`.
+    `source` é o CSV correspondente, cujo tamanho/mtime ficam no header.
+    """
+    arrays = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+    for name in TEXT_COLUMNS:
+        arrays[name] = encode_text(columns[name])
+    meta: Dict[str, Any] = {
+        "rows": len(columns["titles"]),
+        "source": source_stamp(source) if source is not None else None,
+    }
+    for name in META_COLUMNS:
+        meta[name] = list(columns[name])
+    write_arrays(path, arrays, meta)
+
+
+def read_snapshot(path: Path, source: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Lê o snapshot e devolve as colunas para BookStore(**colunas).
+    Com `source`, rejeita o snapshot se o CSV tiver mudado depois dele.
+    """
+    arrays, meta = read_arrays(path)
+    if source is not None and meta["source"] != source_stamp(source):
+        raise SnapshotError("desatualizado em relação ao CSV")
+    n = meta["rows"]
+    columns: Dict[str, Any] = {name: arrays[name] for name in NUMERIC_COLUMNS}
+    columns["titles"] = decode_text(arrays["titles"], n)
+    columns["images"] = [v or None for v in decode_text(arrays["images"], n)]
+    for name in META_COLUMNS:
+        columns[name] = meta[name]
+    return columns
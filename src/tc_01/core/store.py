@@ -0,0 +1,406 @@
+from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tc_01.core.search import BM25Index, TrigramIndex
+from tc_01.core.snapshot import META_COLUMNS, NUMERIC_COLUMNS, TEXT_COLUMNS
+
+# Sentinelas usadas nas colunas numéricas para representar "sem valor"
+NO_ID = -1
+NO_RATING = 0
+
+# Quantas ordenações compostas (ex.: rating_desc,price_asc) ficam em cache
+SORT_CACHE_SIZE = 16
+
+SortKey = Tuple[Tuple[str, bool], ...]
+
+
+def _encode(values: Iterable[str]) -> Tuple[np.ndarray, List[str]]:
+    """
+    Dictionary encoding: ["a", "b", "a"] -> (array([0, 1, 0]), ["a", "b"])
+    """
+    lookup: Dict[str, int] = {}
+    codes: List[int] = []
+    for v in values:
+        code = lookup.get(v)
+        if code is None:
+            code = lookup[v] = len(lookup)
+        codes.append(code)
+    return np.asarray(codes, dtype=np.int32), list(lookup)
+
+
+def records_to_columns(records: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Converte os dicts de `load_books` nas colunas aceitas por BookStore."""
+    n = len(records)
+    ids = np.fromiter(
+        (r["id"] if r["id"] is not None else NO_ID for r in records), dtype=np.int64, count=n
+    )
+    prices = np.fromiter(
+        (r["price"] if r["price"] is not None else np.nan for r in records), dtype=np.float64, count=n
+    )
+    ratings = np.fromiter(
+        (r["rating"] if r["rating"] is not None else NO_RATING for r in records), dtype=np.int8, count=n
+    )
+    in_stock = np.fromiter((bool(r["in_stock"]) for r in records), dtype=np.bool_, count=n)
+    stock_qty = np.fromiter((r["stock_qty"] for r in records), dtype=np.int32, count=n)
+    availability_codes, availability_values = _encode(r["availability_raw"] for r in records)
+    category_codes, categories = _encode(r["category"] for r in records)
+    return {
+        "ids": ids,
+        "titles": [r["title"] for r in records],
+        "prices": prices,
+        "ratings": ratings,
+        "availability_codes": availability_codes,
+        "availability_values": availability_values,
+        "in_stock": in_stock,
+        "stock_qty": stock_qty,
+        "category_codes": category_codes,
+        "categories": categories,
+        "images": [r["image"] for r in records],
+    }
+
+
+class BookStore:
+    """
+    Catálogo em formato colunar.
+
+    Cada campo do livro vira uma coluna tipada (arrays NumPy para os campos
+    numéricos, dictionary encoding para categoria e disponibilidade). Filtros e
+    ordenações trabalham sobre arrays de índices de linha; os dicts só são
+    montados em `rows()`, para as linhas da página devolvida.
+    """
+
+    FIELDS = ("id", "title", "price", "rating", "availability_raw",
+              "in_stock", "stock_qty", "category", "image")
+    SORT_FIELDS = ("id", "title", "price", "rating")
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        titles: Sequence[str],
+        prices: np.ndarray,
+        ratings: np.ndarray,
+        availability_codes: np.ndarray,
+        availability_values: List[Optional[str]],
+        in_stock: np.ndarray,
+        stock_qty: np.ndarray,
+        category_codes: np.ndarray,
+        categories: List[str],
+        images: Sequence[Optional[str]],
+        previous: Optional["BookStore"] = None,
+        version: int = 1,
+        indexes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        `indexes` permite receber as estruturas derivadas já prontas (ex.: de um
+        segmento compartilhado entre workers) em vez de recalculá-las.
+        """
+        # versão do dataset: muda a cada recarga publicada
+        self.version = version
+        self.ids = ids
+        self.titles = titles
+        self.prices = prices
+        self.ratings = ratings
+        self.availability_codes = availability_codes
+        self.availability_values = availability_values
+        self.in_stock = in_stock
+        self.stock_qty = stock_qty
+        self.category_codes = category_codes
+        self.categories = categories
+        self.images = images
+
+        # contagem de livros sem rating (ficam no início de rating_desc)
+        self.unrated_count = int(np.count_nonzero(ratings == NO_RATING))
+        self._sort_lock = threading.Lock()
+        self._sort_lru: "OrderedDict[SortKey, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._category_index = TrigramIndex.build([c.lower() for c in categories])
+        # agregados derivados (estatísticas etc.), calculados sob demanda
+        self._memo_lock = threading.Lock()
+        self._memo: Dict[str, Any] = {}
+
+        if indexes is None:
+            indexes = self._build_indexes(previous)
+        self._id_index = indexes["id_index"]
+        self._title_rank = indexes["title_rank"]
+        self._sort_perms = indexes["sort_perms"]
+        self._title_index = indexes["title_index"]
+        self._fulltext = indexes["fulltext"]
+
+    def _build_indexes(self, previous: Optional["BookStore"]) -> Dict[str, Any]:
+        titles = self.titles
+        # índice hash id -> linha (a primeira ocorrência vence, como na busca linear)
+        id_index: Dict[int, int] = {}
+        for row, book_id in enumerate(self.ids.tolist()):
+            if book_id != NO_ID:
+                id_index.setdefault(book_id, row)
+
+        # chaves de ordenação de título: posição de cada título na ordem lexicográfica
+        _, title_rank = np.unique(np.asarray(titles, dtype=object), return_inverse=True)
+        self._title_rank = title_rank.astype(np.int64).reshape(-1)
+
+        # permutações por campo/direção, calculadas uma vez por versão do dataset
+        identity = self.all()
+        sort_perms: Dict[SortKey, Tuple[np.ndarray, np.ndarray]] = {(): (identity, identity)}
+        for field in self.SORT_FIELDS:
+            for asc in (True, False):
+                key = ((field, asc),)
+                sort_perms[key] = self._compute_permutation(key)
+
+        return {
+            "id_index": id_index,
+            "title_rank": self._title_rank,
+            "sort_perms": sort_perms,
+            # trigramas para o "contains" (reaproveitam a versão anterior, se houver)
+            "title_index": TrigramIndex.build(
+                [t.lower() for t in titles], previous._title_index if previous else None
+            ),
+            # BM25 sobre título + categoria, para a busca ranqueada
+            "fulltext": BM25Index.build(
+                [f"{t} {self.categories[c]}" for t, c in zip(titles, self.category_codes.tolist())]
+            ),
+        }
+
+    def indexes(self) -> Dict[str, Any]:
+        """Estruturas derivadas do catálogo (para exportação; ver core/shared.py)."""
+        return {
+            "id_index": self._id_index,
+            "title_rank": self._title_rank,
+            "sort_perms": self._sort_perms,
+            "title_index": self._title_index,
+            "fulltext": self._fulltext,
+        }
+
+    # --------- construção ---------
+    @classmethod
+    def from_records(
+        cls,
+        records: Sequence[Dict[str, Any]],
+        previous: Optional["BookStore"] = None,
+        version: int = 1,
+    ) -> "BookStore":
+        """
+        Monta o catálogo a partir dos dicts de `load_books`. `previous` é a versão
+        anterior do catálogo, usada para atualizar os índices de forma incremental.
+        """
+        return cls(**records_to_columns(records), previous=previous, version=version)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    # --------- materialização ---------
+    def row(self, i: int) -> Dict[str, Any]:
+        book_id = int(self.ids[i])
+        price = float(self.prices[i])
+        rating = int(self.ratings[i])
+        return {
+            "id": book_id if book_id != NO_ID else None,
+            "title": self.titles[i],
+            "price": price if price == price else None,  # NaN -> None
+            "rating": rating if rating != NO_RATING else None,
+            "availability_raw": self.availability_values[self.availability_codes[i]],
+            "in_stock": bool(self.in_stock[i]),
+            "stock_qty": int(self.stock_qty[i]),
+            "category": self.categories[self.category_codes[i]],
+            "image": self.images[i],
+        }
+
+    def rows(self, idx: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.row(int(i)) for i in idx]
+
+    # --------- seleção ---------
+    def lookup(self, book_id: int) -> Optional[int]:
+        """Linha do livro com esse id, em O(1), ou None."""
+        return self._id_index.get(book_id)
+
+    def lookup_many(self, book_ids: Iterable[int]) -> Tuple[List[int], List[int]]:
+        """
+        Resolve vários ids de uma vez: (linhas encontradas, ids ausentes),
+        mantendo a ordem pedida.
+        """
+        found: List[int] = []
+        missing: List[int] = []
+        for book_id in book_ids:
+            row = self._id_index.get(book_id)
+            if row is None:
+                missing.append(book_id)
+            else:
+                found.append(row)
+        return found, missing
+
+    def all(self) -> np.ndarray:
+        return np.arange(len(self), dtype=np.int64)
+
+    def filter_price(self, lo: float, hi: float, idx: Optional[np.ndarray] = None) -> np.ndarray:
+        """Linhas com preço em [lo, hi] (NaN nunca passa), preservando a ordem de `idx`."""
+        if idx is None:
+            return np.flatnonzero((self.prices >= lo) & (self.prices <= hi))
+        p = self.prices[idx]
+        return idx[(p >= lo) & (p <= hi)]
+
+    def _category_contains(self, needle: str) -> np.ndarray:
+        codes = self._category_index.search(needle)
+        return np.flatnonzero(np.isin(self.category_codes, codes))
+
+    def filter_contains(self, title: Optional[str] = None, category: Optional[str] = None) -> np.ndarray:
+        """
+        Busca contains, case-insensitive, em título e/ou categoria.
+        Retorna os índices das linhas em ordem crescente.
+        """
+        idx = self.all()
+        if title:
+            needle = title.lower()
+            idx = self._title_index.search(needle)
+        if category:
+            idx = np.intersect1d(idx, self._category_contains(category.lower()), assume_unique=True)
+        return idx
+
+    def fulltext(self, query: str, k: int = 20) -> Tuple[int, List[Tuple[int, float]]]:
+        """Busca ranqueada (BM25): (total de linhas casadas, [(linha, score)] top-k)."""
+        return self._fulltext.search(query, k)
+
+    def fuzzy(self, query: str, max_dist: int = 2, k: int = 10) -> List[Tuple[int, int]]:
+        """Títulos com um trecho a até `max_dist` edições da consulta: [(linha, distância)]."""
+        return self._title_index.fuzzy(query.lower(), max_dist, k)
+
+    # --------- ordenação ---------
+    def _sort_keys(self, field: str, asc: bool, idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Chaves equivalentes a `(valor is None, valor)` com reverse=not asc:
+        asc -> nulos no fim; desc -> nulos no início.
+        """
+        if field == "id":
+            col = self.ids[idx]
+            null = col == NO_ID
+        elif field == "price":
+            col = self.prices[idx]
+            null = np.isnan(col)
+            col = np.where(null, 0.0, col)
+        elif field == "rating":
+            col = self.ratings[idx].astype(np.int64)
+            null = col == NO_RATING
+        elif field == "title":
+            col = self._title_rank[idx]
+            null = np.zeros(len(idx), dtype=np.bool_)
+        else:
+            raise KeyError(field)
+        null = null.astype(np.int8)
+        if asc:
+            return null, col
+        return -null, -col
+
+    @staticmethod
+    def normalize_sort(sort_spec: Sequence[Tuple[str, bool]]) -> SortKey:
+        """
+        Forma canônica da especificação: repetições de um campo não mudam a
+        ordem final (o primeiro critério decide), então são descartadas.
+        """
+        seen = set()
+        out = []
+        for field, asc in sort_spec:
+            if field in seen:
+                continue
+            seen.add(field)
+            out.append((field, bool(asc)))
+        return tuple(out)
+
+    def _permutation(self, key: SortKey) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (perm, rank) do catálogo inteiro para a especificação `key`.
+        Critérios simples são calculados na carga; os compostos ficam num LRU.
+        """
+        cached = self._sort_perms.get(key)
+        if cached is not None:
+            return cached
+        with self._sort_lock:
+            cached = self._sort_lru.get(key)
+            if cached is not None:
+                self._sort_lru.move_to_end(key)
+                return cached
+        cached = self._compute_permutation(key)
+        with self._sort_lock:
+            self._sort_lru[key] = cached
+            self._sort_lru.move_to_end(key)
+            while len(self._sort_lru) > SORT_CACHE_SIZE:
+                self._sort_lru.popitem(last=False)
+        return cached
+
+    def _compute_permutation(self, key: SortKey) -> Tuple[np.ndarray, np.ndarray]:
+        idx = self.all()
+        keys: List[np.ndarray] = []
+        # np.lexsort usa a última chave como primária (e é estável)
+        for field, asc in reversed(key):
+            null, col = self._sort_keys(field, asc, idx)
+            keys.append(col)
+            keys.append(null)
+        perm = np.lexsort(keys) if keys else idx
+        rank = np.empty_like(perm)
+        rank[perm] = idx
+        return perm, rank
+
+    def sorted_all(self, sort_spec: Sequence[Tuple[str, bool]]) -> np.ndarray:
+        """Todas as linhas na ordem pedida, sem ordenar na requisição."""
+        return self._permutation(self.normalize_sort(sort_spec))[0]
+
+    def sort(self, idx: np.ndarray, sort_spec: Sequence[Tuple[str, bool]]) -> np.ndarray:
+        """
+        Ordena (de forma estável) os índices `idx` segundo `sort_spec`,
+        ex.: [('rating', False), ('price', True)].
+        `idx` deve estar em ordem crescente de linha, como os filtros devolvem.
+        """
+        if not sort_spec or len(idx) == 0:
+            return idx
+        perm, rank = self._permutation(self.normalize_sort(sort_spec))
+        if len(idx) == len(perm):
+            return perm
+        return idx[np.argsort(rank[idx])]
+
+    # --------- agregados ---------
+    def memo(self, key: str, compute: Callable[["BookStore"], Any]) -> Any:
+        """
+        `compute(self)` calculado uma única vez por versão do dataset: o
+        BookStore não muda depois de montado e a recarga publica outro, então
+        o cache some junto com o snapshot antigo. Requisições simultâneas no
+        primeiro acesso esperam o mesmo cálculo. O valor é compartilhado e
+        não deve ser alterado por quem o recebe.
+        """
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = compute(self)
+            return self._memo[key]
+
+    def content_tag(self) -> str:
+        """
+        Hash do conteúdo do catálogo, base dos ETags (core/caching.py). Ao
+        contrário de `version`, que recomeça em 1 a cada processo, não se
+        repete para dados diferentes depois de um reinício nem entre workers.
+        """
+        return self.memo("content_tag", _content_hash)
+
+    def category_counts(self) -> Dict[str, int]:
+        counts = np.bincount(self.category_codes, minlength=len(self.categories))
+        out: Dict[str, int] = {}
+        for name, n in zip(self.categories, counts.tolist()):
+            if n:
+                key = name or "Uncategorized"
+                out[key] = out.get(key, 0) + n
+        return out
+
+
+def _content_hash(store: BookStore) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    # colunas normalizadas como no snapshot: o mesmo conteúdo dá o mesmo hash
+    # venha o catálogo do CSV, do snapshot ou do segmento compartilhado
+    for name, dtype in NUMERIC_COLUMNS.items():
+        h.update(np.ascontiguousarray(getattr(store, name), dtype=dtype).tobytes())
+    for name in TEXT_COLUMNS + META_COLUMNS:
+        h.update("\0".join(v or "" for v in getattr(store, name)).encode("utf-8"))
+        h.update(b"\1")
+    return h.hexdigest()
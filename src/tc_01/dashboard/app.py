@@ -1,7 +1,12 @@
 # Dashboard Streamlit para métricas da Books API
 from __future__ import annotations
+import json
 import os
-from typing import Iterable, Tuple, Optional, Dict, Any
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Iterable, Tuple, Optional, Dict, Any
 
 import altair as alt
 import pandas as pd
@@ -26,6 +31,16 @@ API_BASE_URL = _get_api_base_url()
 # Endpoint agregado (o que você já tem) e opcional de entradas (se existir)
 ENDPOINT_OVERVIEW = os.getenv("METRICS_ENDPOINT", "/api/v1/metrics/overview").strip()
 ENDPOINT_ENTRIES  = os.getenv("METRICS_ENTRIES",  "/api/v1/metrics/entries").strip()
+ENDPOINT_TIMESERIES = os.getenv("METRICS_TIMESERIES", "/api/v1/metrics/timeseries").strip()
+ENDPOINT_STREAM = os.getenv("METRICS_STREAM", "/api/v1/metrics/stream").strip()
+
+# Entradas de log: página por chamada, quantas manter na sessão e TTL (s) do cache
+ENTRIES_PAGE = 1000
+ENTRIES_KEEP = int(os.getenv("ENTRIES_KEEP", "10000"))
+ENTRIES_TTL_S = int(os.getenv("ENTRIES_TTL_S", "15"))
+
+# Janela local (s) do painel ao vivo, alimentado pelo stream SSE
+LIVE_WINDOW_S = int(os.getenv("LIVE_WINDOW_S", "300"))
 
 # auto-refresh 30s
 if getattr(st, "autorefresh", None):
@@ -34,32 +49,13 @@ if getattr(st, "autorefresh", None):
 st.caption(f"Fonte (overview): {API_BASE_URL}{ENDPOINT_OVERVIEW}")
 
 # ---------------- Fetch helpers ----------------
-def http_get_json(url: str, timeout: int = 20) -> Dict[str, Any]:
-    r = requests.get(url, timeout=timeout)
+def http_get_json(url: str, timeout: int = 20, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    r = requests.get(url, params=params, timeout=timeout)
     r.raise_for_status()
     return r.json()
 
-def try_fetch_entries(api_base: str, endpoint: str) -> Optional[pd.DataFrame]:
-    """Tenta buscar uma lista de logs (entradas). Retorna DataFrame ou None."""
-    try:
-        url = f"{api_base.rstrip('/')}{endpoint}"
-        payload = http_get_json(url)
-    except Exception:
-        return None
-
-    rows = None
-    if isinstance(payload, list):
-        rows = payload
-    elif isinstance(payload, dict):
-        for k in ("entries", "items", "logs", "data", "rows"):
-            v = payload.get(k)
-            if isinstance(v, list):
-                rows = v
-                break
-
-    if not rows:
-        return None
-
+def entries_frame(rows: list) -> pd.DataFrame:
+    """Normaliza as entradas de log num DataFrame (ts, method, path, status, latency_s)."""
     df = pd.DataFrame(rows)
     rename_map = {
         "timestamp": "ts",
@@ -81,55 +77,334 @@ def try_fetch_entries(api_base: str, endpoint: str) -> Optional[pd.DataFrame]:
 
     return df.dropna(how="all", subset=["method","path","status"])
 
-def fetch_overview(api_base: str, endpoint: str) -> Dict[str, Any]:
+@st.cache_data(ttl=ENTRIES_TTL_S, show_spinner=False)
+def fetch_entries_page(url: str, after: Optional[int]) -> Dict[str, Any]:
+    # cacheado por cursor: enquanto não chega nada novo, os reruns dentro do
+    # TTL nem chamam a API
+    params: Dict[str, Any] = {"limit": ENTRIES_PAGE}
+    if after is not None:
+        params["after"] = after
+    return http_get_json(url, params=params)
+
+def try_fetch_entries(api_base: str, endpoint: str) -> Optional[pd.DataFrame]:
+    """
+    Entradas de log acumuladas na sessão. Busca só as novas (cursor `after`
+    de /metrics/entries), acrescenta ao DataFrame guardado e mantém as
+    últimas ENTRIES_KEEP. Retorna DataFrame ou None.
+    """
     url = f"{api_base.rstrip('/')}{endpoint}"
-    return http_get_json(url)
+    cache = st.session_state.get("entries_cache")
+    if cache is None or cache["url"] != url:
+        cache = st.session_state["entries_cache"] = {"url": url, "cursor": None, "df": None}
+    try:
+        while True:
+            payload = fetch_entries_page(url, cache["cursor"])
+            if payload.get("reset"):  # a API reiniciou sem histórico: recomeça
+                cache["df"] = None
+            rows = payload.get("entries") or []
+            if rows:
+                new = entries_frame(rows)
+                df = new if cache["df"] is None else pd.concat([cache["df"], new], ignore_index=True)
+                cache["df"] = df.tail(ENTRIES_KEEP).reset_index(drop=True)
+            cursor = payload.get("next_cursor")
+            if cursor is None or cursor == cache["cursor"]:
+                break
+            cache["cursor"] = cursor
+            if len(rows) < ENTRIES_PAGE:
+                break
+    except Exception:
+        pass  # mantém o que já foi carregado
+    return cache["df"]
 
-# ---------------- Load data ----------------
-overview = fetch_overview(API_BASE_URL, ENDPOINT_OVERVIEW)
+def fetch_timeseries(api_base: str, endpoint: str, step: str, group_by: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Série pré-agregada pela API (um ponto por minuto/hora). Retorna DataFrame ou None."""
+    params = {"step": step}
+    if group_by:
+        params["group_by"] = group_by
+    try:
+        payload = http_get_json(f"{api_base.rstrip('/')}{endpoint}", params=params)
+    except Exception:
+        return None
+    points = payload.get("points") or []
+    if not points:
+        return None
+    ts_df = pd.DataFrame(points)
+    ts_df["ts"] = pd.to_datetime(ts_df["ts"], errors="coerce")
+    return ts_df
+
+class LiveFeed:
+    """
+    Consome o stream SSE da API numa thread: aplica os deltas aos contadores
+    locais e guarda as entradas novas numa janela deslizante de `window_s`
+    segundos. Reconecta sozinho, retomando da última sequência vista.
+    """
+
+    def __init__(self, url: str, window_s: int) -> None:
+        self.url = url
+        self.window_s = window_s
+        self.counters: Dict[str, Any] = {}
+        self.entries: deque = deque()
+        self.seq: Optional[int] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="metrics-live-feed", daemon=True).start()
 
-# KPIs do overview (sempre disponíveis)
-total_requests = int(overview.get("total_requests", 0) or 0)
-avg_resp_s     = float(overview.get("avg_response_time_s", 0) or 0)
-errors         = overview.get("errors", {}) or {}
-err_rate       = float(errors.get("error_rate", 0) or 0)
+    def _run(self) -> None:
+        while True:
+            params = {"interval": 1}
+            if self.seq is not None:
+                params["after"] = self.seq
+            try:
+                with requests.get(self.url, params=params, stream=True, timeout=(5, 60)) as r:
+                    r.raise_for_status()
+                    self.error = None
+                    event, data = None, []
+                    for line in r.iter_lines(decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            self._apply(event, json.loads("\n".join(data)))
+                            event, data = None, []
+            except Exception as e:
+                self.error = repr(e)
+            time.sleep(2)
 
-# Top endpoints agregados (dict path->count)
-top_endpoints: Dict[str, int] = overview.get("top_endpoints", {}) or {}
+    def _apply(self, event: Optional[str], payload: Dict[str, Any]) -> None:
+        with self._lock:
+            if event == "snapshot":
+                self.counters = payload["counters"]
+            else:
+                for key, value in payload["delta"].items():
+                    if isinstance(value, dict):
+                        bucket = self.counters.setdefault(key, {})
+                        for k, v in value.items():
+                            bucket[k] = bucket.get(k, 0) + v
+                    else:
+                        self.counters[key] = self.counters.get(key, 0) + value
+            self.seq = payload["seq"]
+            for e in payload["entries"]:
+                e["ts"] = datetime.strptime(e["timestamp"], "%Y-%m-%d %H:%M:%S,%f")
+                self.entries.append(e)
+            cutoff = time.time() - self.window_s
+            while self.entries and self.entries[0]["ts"].timestamp() < cutoff:
+                self.entries.popleft()
+
+    def snapshot(self) -> Tuple[Dict[str, Any], list]:
+        with self._lock:
+            return json.loads(json.dumps(self.counters)), list(self.entries)
+
+
+@st.cache_resource
+def get_live_feed(url: str, window_s: int) -> LiveFeed:
+    # um único stream por processo do dashboard, compartilhado entre as sessões
+    return LiveFeed(url, window_s)
+
+def fetch_overview(api_base: str, endpoint: str, window: str) -> Dict[str, Any]:
+    url = f"{api_base.rstrip('/')}{endpoint}"
+    return http_get_json(url, params={"window": window})
+
+def initial_state(key: Tuple[Any, ...], fetch: Callable[[], Any]) -> Any:
+    """
+    Resposta REST guardada na sessão: overview e séries são buscados uma vez
+    (estado inicial, por janela/resolução) e não a cada rerun da página; o
+    que muda depois chega pelo stream (LiveFeed).
+    """
+    cache = st.session_state.setdefault("initial_state", {})
+    if key not in cache:
+        cache[key] = fetch()
+    return cache[key]
+
+# ---------------- Load data ----------------
+# Janela deslizante dos percentis de latência (1m/5m/15m/60m na API)
+window = st.sidebar.selectbox("Janela de latência", ["1m", "5m", "15m", "60m"], index=1)
+# Resolução das séries temporais (a API devolve os últimos 60 passos)
+step = st.sidebar.selectbox("Resolução das séries", ["1m", "1h"], index=0)
+if st.sidebar.button("Recarregar histórico"):
+    st.session_state.pop("initial_state", None)
+overview = initial_state(("overview", window), lambda: fetch_overview(API_BASE_URL, ENDPOINT_OVERVIEW, window))
+
+# Percentis de latência na janela (geral e por template de rota)
+latency = overview.get("latency", {}) or {}
+latency_all = latency.get("all", {}) or {}
+latency_routes: Dict[str, Dict[str, Any]] = latency.get("routes", {}) or {}
 
 # Tenta entradas detalhadas (opcional)
 df = try_fetch_entries(API_BASE_URL, ENDPOINT_ENTRIES)
 
-# ---------------- KPIs ----------------
-c1, c2, c3 = st.columns(3)
-c1.metric("Total requests", total_requests)
-c2.metric("Avg resp (s)", round(avg_resp_s, 4))
-c3.metric("Error rate", round(err_rate, 4))
-
-st.divider()
-
-# ---------------- Gráfico: Top endpoints (sempre, via overview) ----------------
-st.subheader("Top endpoints (volume)")
-if top_endpoints:
-    top_df = pd.DataFrame(
-        [{"path": p, "count": c} for p, c in top_endpoints.items()]
-    ).sort_values("count", ascending=False)
-    top_n = st.slider("Quantos exibir", 5, 20, min(10, len(top_df)))
-    chart1 = (
-        alt.Chart(top_df.head(top_n))
+# ---------------- KPIs, ao vivo e top endpoints (stream SSE) ----------------
+@st.fragment(run_every=2)
+def live_section() -> None:
+    feed = get_live_feed(f"{API_BASE_URL.rstrip('/')}{ENDPOINT_STREAM}", LIVE_WINDOW_S)
+    counters, entries = feed.snapshot()
+    live = pd.DataFrame(entries, columns=["ts", "method", "path", "route", "status", "latency_s"])
+
+    # KPIs dos contadores do stream; até o primeiro snapshot, os do overview inicial
+    if counters:
+        total_requests = int(counters.get("total_requests", 0) or 0)
+        avg_resp_s = float(counters.get("latency_sum_s", 0) or 0) / total_requests if total_requests else 0.0
+        err_rate = int(counters.get("errors", 0) or 0) / total_requests if total_requests else 0.0
+        top_endpoints: Dict[str, int] = counters.get("routes", {}) or {}
+    else:
+        total_requests = int(overview.get("total_requests", 0) or 0)
+        avg_resp_s = float(overview.get("avg_response_time_s", 0) or 0)
+        err_rate = float((overview.get("errors", {}) or {}).get("error_rate", 0) or 0)
+        top_endpoints = overview.get("top_endpoints", {}) or {}
+    if live.empty:
+        p95_label, p95 = f"p95 ({window}) (s)", float(latency_all.get("p95", 0) or 0)
+    else:
+        p95_label, p95 = f"p95 (ao vivo, {LIVE_WINDOW_S // 60} min) (s)", float(live["latency_s"].quantile(0.95))
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Total requests", total_requests)
+    c2.metric("Avg resp (s)", round(avg_resp_s, 4))
+    c3.metric(p95_label, round(p95, 4))
+    c4.metric("Error rate", round(err_rate, 4))
+
+    st.subheader(f"Ao vivo – últimos {LIVE_WINDOW_S // 60} min")
+    if not counters:
+        st.info(f"Aguardando o stream de métricas… {feed.error or ''}")
+    else:
+        l1, l2 = st.columns(2)
+        l1.metric("Req/s na janela", round(len(live) / LIVE_WINDOW_S, 2))
+        l2.metric("Erros na janela", int((live["status"] >= 400).sum()) if not live.empty else 0)
+        if not live.empty:
+            per_10s = (
+                live.set_index("ts")
+                    .resample("10s")
+                    .agg({"latency_s": ["count", "mean"]})
+            )
+            per_10s.columns = ["count", "latency_mean_s"]
+            chart_live = (
+                alt.Chart(per_10s.reset_index())
+                   .mark_line(point=True)
+                   .encode(
+                       x=alt.X("ts:T", title="Tempo"),
+                       y=alt.Y("count:Q", title="Requisições / 10 s"),
+                       tooltip=["ts:T", "count:Q", "latency_mean_s:Q"]
+                   )
+                   .properties(height=200)
+            )
+            st.altair_chart(chart_live, use_container_width=True)
+
+    st.divider()
+
+    # ---------------- Gráfico: Top endpoints (contadores do stream) ----------------
+    st.subheader("Top endpoints (volume)")
+    if top_endpoints:
+        top_df = pd.DataFrame(
+            [{"path": p, "count": c} for p, c in top_endpoints.items()]
+        ).sort_values("count", ascending=False)
+        top_n = st.slider("Quantos exibir", 5, 20, min(10, len(top_df)))
+        chart1 = (
+            alt.Chart(top_df.head(top_n))
+               .mark_bar()
+               .encode(
+                   x=alt.X("count:Q", title="Requisições"),
+                   y=alt.Y("path:N", sort="-x", title="Endpoint"),
+                   tooltip=["path","count"]
+               )
+               .properties(height=30 * max(1, min(top_n, len(top_df))))
+        )
+        st.altair_chart(chart1, use_container_width=True)
+    else:
+        st.info("Ainda não há top_endpoints no overview. Gere tráfego na API.")
+
+live_section()
+
+# ---------------- Gráfico: percentis de latência por rota ----------------
+st.subheader(f"Latência por rota – últimos {window}")
+if latency_routes:
+    lat_df = pd.DataFrame(
+        [{"route": r, **v} for r, v in latency_routes.items()]
+    )
+    lat_long = lat_df.melt(
+        id_vars=["route", "count"], value_vars=["p50", "p90", "p95", "p99", "max"],
+        var_name="percentil", value_name="latency_s",
+    )
+    chart_lat = (
+        alt.Chart(lat_long)
            .mark_bar()
            .encode(
-               x=alt.X("count:Q", title="Requisições"),
-               y=alt.Y("path:N", sort="-x", title="Endpoint"),
-               tooltip=["path","count"]
+               y=alt.Y("route:N", sort=list(lat_df["route"]), title="Rota"),
+               x=alt.X("latency_s:Q", title="Latência (s)"),
+               yOffset=alt.YOffset("percentil:N", sort=["p50", "p90", "p95", "p99", "max"]),
+               color=alt.Color("percentil:N", sort=["p50", "p90", "p95", "p99", "max"], title="Percentil"),
+               tooltip=["route", "percentil", "latency_s", "count"]
            )
-           .properties(height=30 * max(1, min(top_n, len(top_df))))
+           .properties(height=90 * max(1, len(lat_df)))
     )
-    st.altair_chart(chart1, use_container_width=True)
+    st.altair_chart(chart_lat, use_container_width=True)
+    st.dataframe(lat_df.set_index("route"), use_container_width=True)
 else:
-    st.info("Ainda não há top_endpoints no overview. Gere tráfego na API.")
+    st.info(f"Nenhuma requisição nos últimos {window}.")
+
+# ---------------- Séries temporais (pré-agregadas na API) ----------------
+ts_df = initial_state(("timeseries", step), lambda: fetch_timeseries(API_BASE_URL, ENDPOINT_TIMESERIES, step))
+by_method = initial_state(
+    ("timeseries", step, "method"),
+    lambda: fetch_timeseries(API_BASE_URL, ENDPOINT_TIMESERIES, step, group_by="method"),
+)
+
+if ts_df is not None and not ts_df.empty:
+    st.divider()
+    st.subheader(f"Séries temporais – passo de {step}")
+
+    lat_ts = ts_df.melt(
+        id_vars=["ts"], value_vars=["latency_avg_s", "p95", "p99"],
+        var_name="métrica", value_name="latency_s",
+    )
+    chart2 = (
+        alt.Chart(lat_ts)
+           .mark_line()
+           .encode(
+               x=alt.X("ts:T", title="Tempo"),
+               y=alt.Y("latency_s:Q", title="Latência (s)"),
+               color=alt.Color("métrica:N", title="Métrica"),
+               tooltip=["ts:T", "métrica:N", "latency_s:Q"]
+           )
+           .properties(height=300, title=f"Latência média e percentis por {step}")
+    )
+    st.altair_chart(chart2, use_container_width=True)
 
-# ---------------- Se houver entradas, plota análises temporais e tabela ----------------
+    chart_count = (
+        alt.Chart(ts_df)
+           .mark_bar()
+           .encode(
+               x=alt.X("ts:T", title="Tempo"),
+               y=alt.Y("count:Q", title="Requisições"),
+               tooltip=["ts:T", "count:Q", "error_rate:Q"]
+           )
+           .properties(height=200, title=f"Requisições por {step}")
+    )
+    st.altair_chart(chart_count, use_container_width=True)
+
+# Proporção por classe HTTP (soma dos pontos da série por método)
+if by_method is not None and not by_method.empty:
+    status_counts = pd.DataFrame(
+        [
+            {"method": row["method"], "class_": cls, "count": n}
+            for _, row in by_method.iterrows()
+            for cls, n in (row["status_classes"] or {}).items()
+        ]
+    )
+    if not status_counts.empty:
+        status_counts = status_counts.groupby(["class_", "method"], as_index=False)["count"].sum()
+        chart3 = (
+            alt.Chart(status_counts)
+               .mark_bar()
+               .encode(
+                   x=alt.X("method:N", title="Método"),
+                   y=alt.Y("count:Q", stack="normalize", title="Proporção"),
+                   color=alt.Color("class_:N", title="Classe HTTP"),
+                   tooltip=["method","class_","count"]
+               )
+               .properties(height=300, title="Proporção por Método e Classe HTTP")
+        )
+        st.altair_chart(chart3, use_container_width=True)
+
+# ---------------- Se houver entradas, mostra a tabela ----------------
 if df is not None and not df.empty:
     st.divider()
     st.subheader("Detalhes (logs) – caso o endpoint de entradas esteja disponível")
@@ -148,51 +423,6 @@ if df is not None and not df.empty:
         f = f[f["path"].astype(str).str.contains(path_contains, case=False, na=False)]
     f = f[(f["status"] >= status_min) & (f["status"] <= status_max)]
 
-    # Latência no tempo (se houver ts)
-    if "ts" in f.columns and f["ts"].notna().any() and "latency_s" in f.columns:
-        f2 = (
-            f.dropna(subset=["ts"])
-             .set_index("ts")
-             .resample("1min")
-             .agg({"latency_s": "mean"})
-             .rename(columns={"latency_s": "latency_mean_s"})
-             .reset_index()
-        )
-        if not f2.empty:
-            chart2 = (
-                alt.Chart(f2)
-                   .mark_line()
-                   .encode(
-                       x=alt.X("ts:T", title="Tempo"),
-                       y=alt.Y("latency_mean_s:Q", title="Latência média (s)"),
-                       tooltip=["ts:T","latency_mean_s:Q"]
-                   )
-                   .properties(height=300, title="Latência média por minuto")
-            )
-            st.altair_chart(chart2, use_container_width=True)
-
-    # Proporção por classe HTTP
-    if "status" in f.columns:
-        status_counts = (
-            f.assign(class_=pd.cut(f["status"], bins=[0,199,299,399,499,599], labels=["1xx","2xx","3xx","4xx","5xx"]))
-             .groupby(["class_", "method"], dropna=True)
-             .size()
-             .reset_index(name="count")
-        )
-        if not status_counts.empty:
-            chart3 = (
-                alt.Chart(status_counts)
-                   .mark_bar()
-                   .encode(
-                       x=alt.X("method:N", title="Método"),
-                       y=alt.Y("count:Q", stack="normalize", title="Proporção"),
-                       color=alt.Color("class_:N", title="Classe HTTP"),
-                       tooltip=["method","class_","count"]
-                   )
-                   .properties(height=300, title="Proporção por Método e Classe HTTP")
-            )
-            st.altair_chart(chart3, use_container_width=True)
-
     st.subheader("Últimas requisições (se entradas estiverem disponíveis)")
     cols_show = [c for c in ["ts","method","path","status","latency_s"] if c in f.columns]
     st.dataframe(
@@ -201,4 +431,3 @@ if df is not None and not df.empty:
     )
 else:
     st.info("Logs detalhados não disponíveis. O dashboard está usando apenas o overview agregado.")
-
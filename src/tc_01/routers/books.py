@@ -1,13 +1,22 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple, Callable
+from typing import List, Optional, Tuple
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field
 
+from tc_01.core.caching import AGGREGATE_MAX_AGE, CATALOG_MAX_AGE, cached
 from tc_01.core.security import auth_required
+from tc_01.core.store import BookStore
 
 router = APIRouter(prefix="/api/v1", tags=["core"])
 
+BATCH_MAX_IDS = 200
+
+class BatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=BATCH_MAX_IDS)
+
 # --------- helpers ---------
-def _paginate(items: List[Dict[str, Any]], page: int, page_size: int) -> Tuple[int, List[Dict[str, Any]]]:
+def _paginate(items: np.ndarray, page: int, page_size: int) -> Tuple[int, np.ndarray]:
     total = len(items)
     start = (page - 1) * page_size
     end = start + page_size
@@ -21,7 +30,7 @@ def _parse_sort(sort: Optional[str]) -> List[Tuple[str, bool]]:
     """
     if not sort:
         return []
-    allowed = {"id", "title", "price", "rating"}
+    allowed = set(BookStore.SORT_FIELDS)
     result: List[Tuple[str, bool]] = []
     for part in sort.split(","):
         part = part.strip().lower()
@@ -39,13 +48,6 @@ def _parse_sort(sort: Optional[str]) -> List[Tuple[str, bool]]:
         result.append((field, asc))
     return result
 
-def _sort_items(items: List[Dict[str, Any]], sort_spec: List[Tuple[str, bool]]) -> List[Dict[str, Any]]:
-    # aplica ordenação estável do Python do último critério para o primeiro
-    out = list(items)
-    for field, asc in reversed(sort_spec):
-        out.sort(key=lambda x: (x.get(field) is None, x.get(field)), reverse=not asc)
-    return out
-
 # --------- endpoints ---------
 
 @router.get("/books", tags=["core"])
@@ -54,7 +56,7 @@ def list_books(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=200),
     sort: Optional[str] = Query(None, description="Ex.: rating_desc,price_asc"),
-    user=Depends(auth_required),
+    user=Depends(cached(CATALOG_MAX_AGE)),
 ):
     """
     Lista livros com paginação e ordenação.
@@ -62,12 +64,9 @@ def list_books(
     - Direções: _asc (padrão) ou _desc
       Ex.: ?sort=rating_desc,price_asc
     """
-    data: List[Dict[str, Any]] = request.app.state.DATA
-    items = data
-
-    sort_spec = _parse_sort(sort)
-    if sort_spec:
-        items = _sort_items(items, sort_spec)
+    store: BookStore = request.app.state.STORE
+    # ordem pré-calculada: a página custa O(page_size)
+    items = store.sorted_all(_parse_sort(sort))
 
     total, page_items = _paginate(items, page, page_size)
     return {
@@ -75,7 +74,7 @@ def list_books(
         "page": page,
         "page_size": page_size,
         "total": total,
-        "items": page_items,
+        "items": store.rows(page_items),
     }
 
 @router.get("/books/search")
@@ -86,26 +85,17 @@ def search_books(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=200),
     sort: Optional[str] = Query(None, description="Ex.: rating_desc,price_asc"),
-    user=Depends(auth_required),
+    user=Depends(cached(CATALOG_MAX_AGE)),
 ):
     """
     Busca por título e/ou categoria (contains, case-insensitive) com paginação e ordenação.
     """
-    data: List[Dict[str, Any]] = request.app.state.DATA
-
-    def _match(b: Dict[str, Any]) -> bool:
-        ok = True
-        if title:
-            ok = ok and (title.lower() in (b.get("title") or "").lower())
-        if category:
-            ok = ok and (category.lower() in (b.get("category") or "").lower())
-        return ok
-
-    filtered = [b for b in data if _match(b)]
+    store: BookStore = request.app.state.STORE
+    filtered = store.filter_contains(title=title, category=category)
 
     sort_spec = _parse_sort(sort)
     if sort_spec:
-        filtered = _sort_items(filtered, sort_spec)
+        filtered = store.sort(filtered, sort_spec)
 
     total, page_items = _paginate(filtered, page, page_size)
     return {
@@ -113,7 +103,58 @@ def search_books(
         "page": page,
         "page_size": page_size,
         "total": total,
-        "items": page_items,
+        "items": store.rows(page_items),
+    }
+
+@router.get("/books/fulltext")
+def fulltext_books(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Texto livre; ignora acentos e caixa"),
+    limit: int = Query(20, ge=1, le=100),
+    user=Depends(cached(CATALOG_MAX_AGE)),
+):
+    """
+    Busca ranqueada (BM25) em título e categoria.
+    Ex.: /api/v1/books/fulltext?q=noah's ark&limit=10
+    """
+    store: BookStore = request.app.state.STORE
+    total, hits = store.fulltext(q, limit)
+    items = []
+    for row, score in hits:
+        item = store.row(row)
+        item["score"] = round(score, 4)
+        items.append(item)
+    return {
+        "user": user["sub"],
+        "query": q,
+        "total": total,
+        "items": items,
+    }
+
+@router.get("/books/fuzzy")
+def fuzzy_books(
+    request: Request,
+    q: str = Query(..., min_length=3, description="Título (ou trecho) com possíveis erros de digitação"),
+    max_distance: int = Query(2, ge=0, le=3),
+    limit: int = Query(10, ge=1, le=100),
+    user=Depends(cached(CATALOG_MAX_AGE)),
+):
+    """
+    Busca tolerante a erros no título: retorna os livros cujo título contém um
+    trecho a até `max_distance` edições de `q`, do mais próximo ao mais distante.
+    Ex.: /api/v1/books/fuzzy?q=harry poter&max_distance=1
+    """
+    store: BookStore = request.app.state.STORE
+    items = []
+    for row, dist in store.fuzzy(q, max_distance, limit):
+        item = store.row(row)
+        item["distance"] = dist
+        items.append(item)
+    return {
+        "user": user["sub"],
+        "query": q,
+        "max_distance": max_distance,
+        "items": items,
     }
 
 @router.get("/books/price-range", tags=["insights"])
@@ -123,7 +164,7 @@ def price_range(
     max: float = Query(999999.0, gt=0.0),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=200),
-    user=Depends(auth_required),
+    user=Depends(cached(CATALOG_MAX_AGE)),
 ):
     """
     Filtra livros por faixa de preço com paginação.
@@ -132,11 +173,8 @@ def price_range(
     if min > max:
         raise HTTPException(status_code=400, detail="Parâmetros inválidos: min > max.")
 
-    data: List[Dict[str, Any]] = request.app.state.DATA
-    filtered = [
-        b for b in data
-        if isinstance(b.get("price"), (int, float)) and (min <= b["price"] <= max)
-    ]
+    store: BookStore = request.app.state.STORE
+    filtered = store.filter_price(min, max)
 
     total, page_items = _paginate(filtered, page, page_size)
     return {
@@ -146,22 +184,41 @@ def price_range(
         "page": page,
         "page_size": page_size,
         "total": total,
-        "items": page_items,
+        "items": store.rows(page_items),
     }
 
 @router.get("/books/{book_id}")
 def get_book_by_id(
     book_id: int,
     request: Request,
-    user=Depends(auth_required),
+    user=Depends(cached(AGGREGATE_MAX_AGE)),
 ):
     """
     Retorna detalhes de um livro pelo ID.
     """
-    data: List[Dict[str, Any]] = request.app.state.DATA
-    for b in data:
-        if b.get("id") == book_id:
-            return {"user": user["sub"], "item": b}
+    store: BookStore = request.app.state.STORE
+    row = store.lookup(book_id)
+    if row is not None:
+        return {"user": user["sub"], "item": store.row(row)}
     raise HTTPException(status_code=404, detail=f"Livro id={book_id} não encontrado")
 
+@router.post("/books/batch")
+def get_books_batch(
+    body: BatchRequest,
+    request: Request,
+    user=Depends(auth_required),
+):
+    """
+    Retorna vários livros em uma única chamada.
+    Ex.: {"ids": [1, 2, 3]}  (máx. 200 ids; repetidos são ignorados)
+    """
+    store: BookStore = request.app.state.STORE
+    rows, missing = store.lookup_many(dict.fromkeys(body.ids))
+    return {
+        "user": user["sub"],
+        "total": len(rows),
+        "items": store.rows(rows),
+        "missing": missing,
+    }
+
 
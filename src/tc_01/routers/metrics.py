@@ -1,88 +1,135 @@
 from __future__ import annotations
-import os, re
-from pathlib import Path
-from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, Query, HTTPException
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
-router = APIRouter(prefix="/api/v1/metrics", tags=["metrics"])
-
-# Arquivo de log (mesmo usado no middleware). Permite sobrescrever por ENV.
-PROJECT_ROOT = Path(__file__).resolve().parents[2]  # .../src/tc_01
-LOG_FILE = Path(os.getenv("LOG_FILE", PROJECT_ROOT.parent / "api_logs.log"))
-
-# ---- helpers ----
-_line_rx = re.compile(
-    r"""^(?P<ts>\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2},\d{3})\s+-\s+\w+\s+-\s+
-        (?P<method>GET|POST|PUT|DELETE|PATCH|OPTIONS|HEAD)\s+
-        (?P<path>\S+)\s+
-        status=(?P<status>\d{3})\s+
-        (?P<latency_s>\d+(?:\.\d+)?)s\s*$""",
-    re.VERBOSE
-)
+from tc_01.core.metrics import ROLLUP_STEPS, select_entries, to_entry
+from tc_01.core.security import TOKEN_CACHE, role_required
 
-def _parse_log(path: Path) -> List[Dict[str, Any]]:
-    if not path.exists():
-        return []
-    rows: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            m = _line_rx.match(line.strip())
-            if not m:
-                continue
-            rows.append({
-                "timestamp": m.group("ts"),
-                "method": m.group("method"),
-                "path": m.group("path"),
-                "status": int(m.group("status")),
-                "latency_s": float(m.group("latency_s")),
-            })
-    return rows
+router = APIRouter(prefix="/api/v1/metrics", tags=["metrics"])
 
 # ---- agregado (o que você já tem) ----
 @router.get("/overview")
-def metrics_overview() -> Dict[str, Any]:
-    entries = _parse_log(LOG_FILE)
-    total = len(entries)
-    avg_resp = round(sum(e["latency_s"] for e in entries) / total, 6) if total else 0.0
-
-    # top endpoints
-    top: Dict[str, int] = {}
-    for e in entries:
-        top[e["path"]] = top.get(e["path"], 0) + 1
-    top_sorted = dict(sorted(top.items(), key=lambda kv: kv[1], reverse=True)[:20])
-
-    # erros
-    err_count = sum(1 for e in entries if e["status"] >= 400)
-    err_rate = round(err_count / total, 6) if total else 0.0
-    c4xx = sum(1 for e in entries if 400 <= e["status"] <= 499)
-    c5xx = sum(1 for e in entries if 500 <= e["status"] <= 599)
+def metrics_overview(
+    request: Request,
+    window: str = Query("5m", pattern="^(1m|5m|15m|60m)$", description="Janela dos percentis de latência"),
+) -> Dict[str, Any]:
+    return request.app.state.metrics.overview(window)
 
-    return {
-        "total_requests": total,
-        "avg_response_time_s": avg_resp,
-        "top_endpoints": top_sorted,
-        "errors": {"4xx_count": c4xx, "5xx_count": c5xx, "error_rate": err_rate},
-    }
+@router.get("/auth-cache")
+def metrics_auth_cache(user=Depends(role_required("admin"))) -> Dict[str, Any]:
+    """Tamanho e taxa de acerto do cache de tokens verificados (só admin)."""
+    return TOKEN_CACHE.stats()
 
 # ---- detalhado (novo) ----
 @router.get("/entries")
 def metrics_entries(
+    request: Request,
     limit: int = Query(1000, ge=1, le=10000),
-    method: Optional[str] = Query(None, regex="^(GET|POST|PUT|DELETE|PATCH|OPTIONS|HEAD)$"),
+    method: Optional[str] = Query(None, pattern="^(GET|POST|PUT|DELETE|PATCH|OPTIONS|HEAD)$"),
     path_contains: Optional[str] = None,
     status_min: int = Query(100, ge=100, le=599),
     status_max: int = Query(599, ge=100, le=599),
+    since: Optional[datetime] = Query(None, description="Início da janela (ISO 8601); lê do log estruturado"),
+    until: Optional[datetime] = Query(None, description="Fim da janela (ISO 8601); lê do log estruturado"),
+    after: Optional[int] = Query(None, ge=0, description="Cursor (`next_cursor` da resposta anterior): só entradas novas"),
 ) -> Dict[str, Any]:
-    entries = _parse_log(LOG_FILE)
+    if since is None and until is None:
+        # sem janela: direto do buffer em memória; com `after`, só o que é novo
+        page = request.app.state.metrics.entries(limit, method, path_contains, status_min, status_max, after=after)
+        return {**page, "count": len(page["entries"])}
+    if after is not None:
+        raise HTTPException(status_code=400, detail="after não pode ser combinado com since/until")
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since deve ser anterior a until")
+    # com janela: o índice dos segmentos leva direto aos blocos do intervalo
+    records = request.app.state.request_log.iter_reverse(
+        since.timestamp() if since else None, until.timestamp() if until else None
+    )
+    entries = select_entries(map(to_entry, records), limit, method, path_contains, status_min, status_max)
+    return {"entries": entries, "count": len(entries)}
 
-    # filtros
-    if method:
-        entries = [e for e in entries if e["method"] == method]
-    if path_contains:
-        s = path_contains.lower()
-        entries = [e for e in entries if s in e["path"].lower()]
-    entries = [e for e in entries if status_min <= e["status"] <= status_max]
+# ---- séries temporais (pré-agregadas por minuto/hora) ----
+@router.get("/timeseries")
+def metrics_timeseries(
+    request: Request,
+    from_: Optional[datetime] = Query(None, alias="from", description="Início (ISO 8601); padrão: 60 passos antes de `to`"),
+    to: Optional[datetime] = Query(None, description="Fim (ISO 8601); padrão: agora"),
+    step: str = Query("1m", pattern="^(1m|1h)$"),
+    route: Optional[str] = Query(None, description="Template da rota, ex.: /api/v1/books/{book_id}"),
+    method: Optional[str] = Query(None, pattern="^(GET|POST|PUT|DELETE|PATCH|OPTIONS|HEAD)$"),
+    group_by: Optional[str] = Query(None, pattern="^(route|method)$"),
+) -> Dict[str, Any]:
+    seconds = ROLLUP_STEPS[step][0]
+    end = to.timestamp() if to else time.time()
+    start = from_.timestamp() if from_ else end - 60 * seconds
+    if start > end:
+        raise HTTPException(status_code=400, detail="from deve ser anterior a to")
+    points = request.app.state.metrics.timeseries(step, start, end, route, method, group_by)
+    return {
+        "step": step,
+        "from": datetime.fromtimestamp(start).isoformat(),
+        "to": datetime.fromtimestamp(end).isoformat(),
+        "points": points,
+        "count": len(points),
+    }
 
-    entries = entries[-limit:] if len(entries) > limit else entries
-    return {"entries": entries, "count": len(entries)}
+# ---- stream (SSE) ----
+def _sse(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _delta(prev: Dict[str, Any], cur: Dict[str, Any]) -> Dict[str, Any]:
+    """Diferença entre dois `MetricsRegistry.counters()`; dicionários só com as chaves que mudaram."""
+    delta: Dict[str, Any] = {}
+    for key, value in cur.items():
+        if isinstance(value, dict):
+            old = prev.get(key, {})
+            delta[key] = {k: v - old.get(k, 0) for k, v in value.items() if v != old.get(k, 0)}
+        else:
+            delta[key] = round(value - prev.get(key, 0), 6) if isinstance(value, float) else value - prev.get(key, 0)
+    return delta
+
+
+@router.get("/stream")
+async def metrics_stream(
+    request: Request,
+    interval: float = Query(1.0, ge=0.2, le=30, description="Segundos entre eventos"),
+    after: Optional[int] = Query(None, ge=0, description="Sequência já vista; entradas posteriores vêm no primeiro evento"),
+) -> StreamingResponse:
+    """
+    Server-Sent Events: um evento `snapshot` com os contadores acumulados e,
+    a cada `interval`, um evento `delta` com o que mudou nos contadores e as
+    entradas novas (cada uma com `seq`). Sem novidades, só um comentário de
+    keep-alive.
+    """
+    metrics = request.app.state.metrics
+
+    async def events():
+        seq, counters, entries, dropped = metrics.changes(metrics.total if after is None else after)
+        yield _sse("snapshot", {"seq": seq, "counters": counters, "entries": entries, "dropped": dropped})
+        while True:
+            await asyncio.sleep(interval)
+            if await request.is_disconnected():
+                break
+            new_seq, new_counters, entries, dropped = metrics.changes(seq)
+            if new_seq == seq:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse("delta", {
+                "seq": new_seq,
+                "delta": _delta(counters, new_counters),
+                "entries": entries,
+                "dropped": dropped,
+            })
+            seq, counters = new_seq, new_counters
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
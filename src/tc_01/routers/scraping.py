@@ -1,16 +1,48 @@
-from fastapi import APIRouter, BackgroundTasks, Depends
-import subprocess, sys
-from tc_01.core.security import auth_required
-
-router = APIRouter(prefix="/api/v1/scraping", tags=["insights"])
-
-def _run_scraping_subprocess():
-    # executa: python -m tc_01.scripts.scraping
-    cmd = [sys.executable, "-m", "tc_01.scripts.scraping"]
-    # se o script imprimir logs, eles aparecem no log do container
-    subprocess.run(cmd, check=False)
-
-@router.post("/trigger")
-def trigger(background_tasks: BackgroundTasks, user=Depends(auth_required)):
-    background_tasks.add_task(_run_scraping_subprocess)
-    return {"message": "scraping started"}
+from fastapi import APIRouter, Depends, HTTPException, Request
+from tc_01.core.jobs import ScrapingJobs
+from tc_01.core.security import auth_required, role_required
+
+router = APIRouter(prefix="/api/v1/scraping", tags=["admin"])
+
+
+def _jobs(request: Request) -> ScrapingJobs:
+    return request.app.state.scraping
+
+
+@router.post("/trigger", status_code=202)
+def trigger(request: Request, full: bool = False, user=Depends(role_required("admin"))):
+    """
+    Dispara uma coleta (incremental; `full=true` para baixar tudo) num processo
+    separado. Se já houver uma em andamento, devolve o job existente.
+    """
+    job, created = _jobs(request).trigger(requested_by=user.get("sub"), full=full)
+    return {
+        "message": "scraping started" if created else "scraping already running",
+        "job": job.snapshot(),
+    }
+
+
+@router.get("/jobs")
+def list_jobs(request: Request, user=Depends(auth_required)):
+    items = [job.snapshot() for job in _jobs(request).list()]
+    return {"total": len(items), "items": items}
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, request: Request, user=Depends(auth_required)):
+    """Status e progresso (páginas, livros, throughput, ETA) de um job."""
+    job = _jobs(request).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.snapshot()
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, request: Request, user=Depends(role_required("admin"))):
+    """Cancela a coleta; a próxima retoma do último checkpoint."""
+    job = _jobs(request).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Job não está em execução ({job.status})")
+    return job.snapshot()
@@ -0,0 +1,336 @@
+"""
+Micro-benchmarks da API.
+
+Uso: python -m tc_01.scripts.benchmarks <cenário> [opções]
+Ex.: python -m tc_01.scripts.benchmarks fuzzy --rows 1000000
+     python -m tc_01.scripts.benchmarks startup --rows 1000 100000
+     python -m tc_01.scripts.benchmarks parse --pages 40
+     python -m tc_01.scripts.benchmarks middleware --requests 20000
+     python -m tc_01.scripts.benchmarks insights --rows 1000 100000
+     python -m tc_01.scripts.benchmarks auth --requests 50000
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import random
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+
+from tc_01.config.variables import Config
+from tc_01.core.dataset import load_books, parse_rows
+from tc_01.core.search import TrigramIndex, substring_distance
+from tc_01.core.snapshot import read_snapshot, snapshot_path
+from tc_01.core.store import BookStore
+
+
+def synthetic_titles(rows, seed=42):
+    """
+    Gera `rows` títulos sintéticos embaralhando palavras dos títulos reais do CSV.
+    """
+    rnd = random.Random(seed)
+    words = [w for b in load_books(Config.CSV_FILE) for w in b["title"].split()]
+    return [" ".join(rnd.choices(words, k=rnd.randint(2, 9))) for _ in range(rows)]
+
+
+def synthetic_rows(rows, seed=42):
+    """
+    Gera `rows` linhas no formato do scraper (strings cruas), com títulos sintéticos.
+    """
+    with open(Config.CSV_FILE, newline="", encoding="utf-8") as f:
+        base = list(csv.DictReader(f, delimiter=";"))
+    titles = synthetic_titles(rows, seed)
+    return [
+        {**base[i % len(base)], "id": i + 1, "title": titles[i]}
+        for i in range(rows)
+    ]
+
+
+def _typo(rnd, s):
+    """Aplica um erro de digitação (troca, remoção ou inserção de um caractere)."""
+    i = rnd.randrange(len(s))
+    op = rnd.randint(0, 2)
+    c = rnd.choice("abcdefghijklmnopqrstuvwxyz")
+    if op == 0:
+        return s[:i] + c + s[i + 1:]
+    if op == 1:
+        return s[:i] + s[i + 1:]
+    return s[:i] + c + s[i:]
+
+
+def _timeit(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / max(len(items), 1)
+
+
+def bench_fuzzy(args):
+    """Busca fuzzy indexada (trigramas + corte) vs varredura com distância de edição."""
+    rnd = random.Random(7)
+    docs = [t.lower() for t in synthetic_titles(args.rows)]
+    start = time.perf_counter()
+    index = TrigramIndex.build(docs)
+    print(f"rows={args.rows} build={time.perf_counter() - start:.2f}s")
+
+    queries = []
+    while len(queries) < args.queries:
+        doc = rnd.choice(docs)
+        if len(doc) < 12:
+            continue
+        a = rnd.randint(0, len(doc) - 12)
+        queries.append(_typo(rnd, doc[a:a + 12]))
+
+    expected = {}
+
+    def naive(q):
+        hits = []
+        for i, d in enumerate(docs):
+            dist = substring_distance(q, d, args.max_distance)
+            if dist is not None:
+                hits.append((dist, i))
+        expected[q] = [(i, dist) for dist, i in sorted(hits)[: args.limit]]
+
+    indexed = _timeit(lambda q: index.fuzzy(q, args.max_distance, args.limit), queries)
+    scan = _timeit(naive, queries[: args.naive_queries])
+    same = sum(index.fuzzy(q, args.max_distance, args.limit) == hits for q, hits in expected.items())
+    print(f"fuzzy indexado: {indexed * 1000:.2f} ms/consulta")
+    print(f"varredura:      {scan * 1000:.2f} ms/consulta ({scan / indexed:.0f}x)")
+    print(f"mesmo top-{args.limit} da varredura: {same}/{len(expected)} consultas")
+
+
+def bench_startup(args):
+    """Tempo de carga do catálogo: CSV (parse linha a linha) vs snapshot binário."""
+    from tc_01.scripts.scraping import save_to_csv
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_file = Path(tmp) / "books.csv"
+            save_to_csv(synthetic_rows(rows), filename=csv_file)
+
+            start = time.perf_counter()
+            records = load_books(csv_file)
+            parse_csv = time.perf_counter() - start
+
+            start = time.perf_counter()
+            columns = read_snapshot(snapshot_path(csv_file), source=csv_file)
+            read_snap = time.perf_counter() - start
+
+            start = time.perf_counter()
+            BookStore(**columns)
+            build = time.perf_counter() - start
+
+            print(
+                f"rows={rows:>9}  csv={parse_csv:8.3f}s  snapshot={read_snap:8.3f}s "
+                f"({parse_csv / read_snap:.0f}x)  índices={build:8.3f}s"
+            )
+            del records
+
+
+FIXTURES_DIR = Config.DATA_DIR / "fixtures"
+
+
+def load_fixtures(directory, pages):
+    """
+    Páginas de listagem salvas em `directory` como [(categoria, html), ...].
+    Na primeira execução, baixa `pages` páginas de Config.URL_BASE e as salva.
+    """
+    index = directory / "index.json"
+    if not index.exists():
+        from tc_01.scripts.scraping import Manifest, fetch_pages, get_categories
+
+        directory.mkdir(parents=True, exist_ok=True)
+        saved = []
+        for page in islice(fetch_pages(get_categories(Config.URL_BASE), Manifest()), pages):
+            name = f"{len(saved):03d}.html"
+            (directory / name).write_text(page["html"], encoding="utf-8")
+            saved.append({"file": name, "category": page["category"], "url": page["url"]})
+        index.write_text(json.dumps(saved, ensure_ascii=False, indent=1), encoding="utf-8")
+    entries = json.loads(index.read_text(encoding="utf-8"))
+    return [(e["category"], (directory / e["file"]).read_text(encoding="utf-8")) for e in entries]
+
+
+def bench_parse(args):
+    """Backends de parse das páginas de listagem, sobre páginas salvas (fixtures)."""
+    from tc_01.scripts.parsers import BACKENDS, parse_listing
+    from tc_01.scripts.scraping import parse_pages
+
+    fixtures = load_fixtures(Path(args.fixtures), args.pages)
+    reference = [parse_listing(html, category, "soup") for category, html in fixtures]
+    print(f"páginas={len(fixtures)} livros={sum(map(len, reference))}")
+
+    baseline = None
+    for name in BACKENDS:
+        if [parse_listing(html, category, name) for category, html in fixtures] != reference:
+            raise SystemExit(f"backend {name} diverge do html.parser completo")
+        per_page = _timeit(lambda f: parse_listing(f[1], f[0], name), fixtures * args.repeat)
+        baseline = baseline or per_page
+        print(f"{name:<9} {per_page * 1000:7.2f} ms/página ({baseline / per_page:.1f}x)")
+
+    if args.workers:
+        pages = [{"category": c, "html": h, "rows": None} for c, h in fixtures * args.repeat]
+        start = time.perf_counter()
+        for _ in parse_pages(pages, workers=args.workers):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"pool de {args.workers} processos: {len(pages) / elapsed:.0f} páginas/s (inclui subir o pool)")
+
+
+def _legacy_middleware(log_file):
+    """O middleware anterior: BaseHTTPMiddleware, time.time() e log síncrono no arquivo."""
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    logger = logging.getLogger("benchmarks.legacy")
+    logger.propagate = False
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+
+    class LegacyLogRequestsMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            start_time = time.time()
+            response = await call_next(request)
+            process_time = time.time() - start_time
+            logger.info(f"{request.method} {request.url.path} status={response.status_code} {process_time:.3f}s")
+            return response
+
+    return LegacyLogRequestsMiddleware
+
+
+async def _drive(app, requests, concurrency):
+    """Chama a app ASGI diretamente (sem rede) e devolve requisições/s."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i):
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/items/{i % 100}", "raw_path": f"/items/{i % 100}".encode(),
+            "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+
+    start = time.perf_counter()
+    for first in range(0, requests, concurrency):
+        await asyncio.gather(*(app(scope(i), receive, send) for i in range(first, min(first + concurrency, requests))))
+    return requests / (time.perf_counter() - start)
+
+
+def bench_middleware(args):
+    """Vazão da API com o middleware de log antigo (BaseHTTPMiddleware) vs o ASGI puro."""
+    from fastapi import FastAPI
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.LOG_DIR = Path(tmp)  # antes de importar tc_01.core.logs, que abre os logs ali
+        from tc_01.core.logs import LogRequestsMiddleware
+
+        def make_app(middleware=None):
+            app = FastAPI()
+
+            @app.get("/items/{item_id}")
+            async def item(item_id: int):
+                return {"id": item_id}
+
+            if middleware is not None:
+                app.add_middleware(middleware)
+            return app
+
+        variants = [
+            ("sem middleware", make_app()),
+            ("BaseHTTPMiddleware", make_app(_legacy_middleware(Path(tmp) / "legacy.log"))),
+            ("ASGI + fila", make_app(LogRequestsMiddleware)),
+        ]
+        for _, app in variants:  # aquecimento
+            asyncio.run(_drive(app, 200, args.concurrency))
+        baseline = None
+        for name, app in variants:
+            rate = max(asyncio.run(_drive(app, args.requests, args.concurrency)) for _ in range(args.repeat))
+            baseline = baseline or rate
+            print(f"{name:<20} {rate:9.0f} req/s ({rate / baseline:.2f}x)")
+
+
+def bench_insights(args):
+    """Agregados de /stats e /categories: cálculo a cada requisição vs memo por versão do dataset."""
+    from tc_01.core import insights
+
+    aggregates = [
+        ("stats/overview", insights.overview),
+        ("stats/categories", insights.categories),
+        ("categories", insights.category_list),
+    ]
+    for rows in args.rows:
+        store = BookStore.from_records(parse_rows(synthetic_rows(rows)))
+        print(f"rows={rows}")
+        for name, compute in aggregates:
+            cold = _timeit(compute, [store] * args.repeat)
+            store.memo(name, compute)
+            hit = _timeit(lambda s: s.memo(name, compute), [store] * 10_000)
+            print(f"  {name:<17} cálculo={cold * 1000:9.3f} ms  memo={hit * 1e6:6.2f} µs ({cold / hit:,.0f}x)")
+
+
+def bench_auth(args):
+    """Custo de auth_required por requisição: verificação do JWT a cada vez vs cache de tokens verificados."""
+    from fastapi.security import HTTPAuthorizationCredentials
+    from tc_01.core import security
+
+    cred = HTTPAuthorizationCredentials(scheme="Bearer", credentials=security.create_access_token("admin", ["admin"]))
+    creds = [cred] * args.requests
+
+    def uncached(c):
+        security.TOKEN_CACHE.clear()
+        return security.auth_required(c)
+
+    clear_only = _timeit(lambda c: security.TOKEN_CACHE.clear(), creds)
+    verify = _timeit(uncached, creds) - clear_only
+    security.TOKEN_CACHE = security.TokenCache()  # contadores zerados
+    hit = _timeit(security.auth_required, creds)
+    print(f"sem cache: {verify * 1e6:6.2f} µs/requisição")
+    print(f"com cache: {hit * 1e6:6.2f} µs/requisição ({verify / hit:.1f}x)  {security.TOKEN_CACHE.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks da Books API")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    p = sub.add_parser("fuzzy", help="busca fuzzy de títulos")
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--naive-queries", type=int, default=3)
+    p.add_argument("--max-distance", type=int, default=2)
+    p.add_argument("--limit", type=int, default=10)
+    p.set_defaults(run=bench_fuzzy)
+
+    p = sub.add_parser("startup", help="carga do catálogo (CSV vs snapshot)")
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    p.set_defaults(run=bench_startup)
+
+    p = sub.add_parser("parse", help="parse das páginas do scraper (backends)")
+    p.add_argument("--fixtures", default=str(FIXTURES_DIR), help="diretório das páginas salvas")
+    p.add_argument("--pages", type=int, default=40, help="páginas a baixar se ainda não houver fixtures")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--workers", type=int, default=0, help="mede também o parse num pool de processos")
+    p.set_defaults(run=bench_parse)
+
+    p = sub.add_parser("middleware", help="vazão com o middleware de log antigo vs ASGI")
+    p.add_argument("--requests", type=int, default=20_000)
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(run=bench_middleware)
+
+    p = sub.add_parser("insights", help="agregados de insights: recálculo vs memo por versão")
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000])
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(run=bench_insights)
+
+    p = sub.add_parser("auth", help="auth_required com e sem o cache de tokens")
+    p.add_argument("--requests", type=int, default=50_000)
+    p.set_defaults(run=bench_auth)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,97 @@
+"""
+Backends de parse das páginas de listagem do books.toscrape.com.
+
+Todos recebem o HTML de uma página e devolvem a mesma lista de livros (sem id):
+  soup      árvore completa do BeautifulSoup (html.parser) -- referência
+  strainer  BeautifulSoup montando só os <article class="product_pod">
+  lxml      XPath direto sobre a árvore do lxml (se o lxml estiver instalado)
+
+O padrão é o mais rápido disponível e pode ser trocado com SCRAPING_PARSER.
+As funções são de módulo (picláveis) para rodar num pool de processos.
+"""
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:  # backend opcional
+    lxml = None
+
+
+def parse_books(soup, category_name):
+    """
+    Extrai os livros (sem id) de uma página de listagem já parseada.
+    """
+    books = []
+    for book in soup.find_all("article", class_="product_pod"):
+        books.append(
+            {
+                "title": book.find("h3").find("a").get("title").strip(),
+                "price": book.find("p", class_="price_color").text.strip(),
+                "rating": book.find("p", class_="star-rating")
+                .get("class")[1]
+                .strip(),
+                "availability": book.find(
+                    "p", class_="instock availability"
+                ).text.strip(),
+                "category": category_name.strip(),
+                "image": book.find("img").get("src").strip(),
+            }
+        )
+    return books
+
+
+def parse_soup(html, category_name):
+    return parse_books(BeautifulSoup(html, "html.parser"), category_name)
+
+
+_products = SoupStrainer("article", class_="product_pod")
+
+
+def parse_strainer(html, category_name):
+    # o tokenizer ainda percorre a página toda, mas só os produtos viram árvore
+    return parse_books(BeautifulSoup(html, "html.parser", parse_only=_products), category_name)
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_XPATH_PRODUCTS = f"//article[{_has_class('product_pod')}]"
+_XPATH_PRICE = f".//p[{_has_class('price_color')}]"
+_XPATH_RATING = f".//p[{_has_class('star-rating')}]"
+
+
+def parse_lxml(html, category_name):
+    tree = lxml.html.fromstring(html)
+    books = []
+    for book in tree.xpath(_XPATH_PRODUCTS):
+        books.append(
+            {
+                "title": book.xpath(".//h3//a")[0].get("title").strip(),
+                "price": book.xpath(_XPATH_PRICE)[0].text_content().strip(),
+                "rating": book.xpath(_XPATH_RATING)[0].get("class").split()[1].strip(),
+                "availability": book.xpath('.//p[@class="instock availability"]')[0].text_content().strip(),
+                "category": category_name.strip(),
+                "image": book.xpath(".//img")[0].get("src").strip(),
+            }
+        )
+    return books
+
+
+BACKENDS = {"soup": parse_soup, "strainer": parse_strainer}
+if lxml is not None:
+    BACKENDS["lxml"] = parse_lxml
+
+DEFAULT_BACKEND = os.getenv("SCRAPING_PARSER") or ("lxml" if lxml is not None else "strainer")
+
+
+def parse_listing(html, category_name, backend=None):
+    """Livros (sem id) da página `html` com o backend `backend` (nome)."""
+    name = backend or DEFAULT_BACKEND
+    try:
+        parse = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Parser desconhecido: {name!r} (disponíveis: {', '.join(BACKENDS)})") from None
+    return parse(html, category_name)
@@ -1,27 +1,105 @@
+import argparse
 import csv
+import fcntl
+import filecmp
+import hashlib
+import json
+import multiprocessing
 import os
+import queue
+import random
+import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
 from tc_01.config.variables import Config
+from tc_01.core.dataset import load_books
+from tc_01.core.snapshot import snapshot_path, source_stamp, write_snapshot
+from tc_01.core.store import records_to_columns
+from tc_01.scripts.parsers import parse_listing
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
 
+# Concorrência do crawl: categorias em paralelo, limitadas por host
+MAX_WORKERS = int(os.getenv("SCRAPING_WORKERS", "8"))
+MAX_PER_HOST = int(os.getenv("SCRAPING_PER_HOST", "8"))
+# Respostas que valem nova tentativa (além de erros de conexão/timeout)
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def get_with_retry(url, max_retries=3, delay=2):
+
+class HostLimiter:
+    """
+    Limita o número de requisições simultâneas por host (um semáforo por netloc).
+    """
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            sem = self._slots.get(host)
+            if sem is None:
+                sem = self._slots[host] = threading.BoundedSemaphore(self.per_host)
+        with sem:
+            yield
+
+
+host_limiter = HostLimiter(MAX_PER_HOST)
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Sessão HTTP compartilhada com pool de conexões keep-alive, dimensionado
+    para os workers do crawl.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_PER_HOST, pool_maxsize=max(MAX_WORKERS, MAX_PER_HOST))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+def backoff(attempt, delay):
+    """
+    Espera antes da próxima tentativa: exponencial com jitter total,
+    uniforme em [0, delay * 2^attempt], para os workers não baterem juntos.
     """
-    Faz uma requisição HTTP com retry automático para uma URL específica, com um máximo de tentativas e um atraso entre tentativas. Retorna a resposta da requisição.
+    return random.uniform(0, delay * 2 ** attempt)
+
+
+def get_with_retry(url, max_retries=3, delay=2, session=None, headers=None):
     """
+    Faz uma requisição HTTP com retry automático para uma URL específica, com um máximo de tentativas e backoff exponencial entre elas. Retorna a resposta da requisição (None se todas as tentativas falharem na conexão).
+    """
+    session = session or get_session()
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=20)
+            with host_limiter.slot(url):
+                response = session.get(url, timeout=20, headers=headers)
             response.encoding = "utf-8"
-            return response
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(delay)
-            else:
+            if response.status_code not in RETRY_STATUS or attempt == max_retries - 1:
+                return response
+        except requests.RequestException:
+            if attempt == max_retries - 1:
                 return None
+        time.sleep(backoff(attempt, delay))
     return None
 
 
@@ -43,6 +121,10 @@ def get_parent_url(url):
     return f"{parsed_url.scheme}://{parsed_url.netloc}{new_path}"
 
 
+class ScrapeFailed(RuntimeError):
+    """A coleta ficou incompleta (categorias ou páginas que não foram baixadas)."""
+
+
 def get_categories(url):
     """
     Retorna todas as categorias do site, em um dicionário de forma organizada, de forma que possa ser usado para o scraping dos livros.
@@ -61,101 +143,497 @@ def get_categories(url):
     return dict_categories
 
 
-def get_books(categories):
+def manifest_path(csv_path):
+    """books_data.csv -> books_data.manifest.json"""
+    return Path(csv_path).with_suffix(".manifest.json")
+
+
+class Manifest:
     """
-    Coleta os livros de todas as categorias passadas como parâmetro
+    Estado da coleta anterior, para a coleta incremental.
+
+    Para cada URL de página guarda ETag/Last-Modified, o hash do corpo, a
+    próxima página e a fatia (offset, count) que ela ocupa nas linhas da sua
+    categoria no CSV. Só vale enquanto o CSV for exatamente o que ele descreve
+    (tamanho/mtime conferidos); caso contrário a coleta é completa.
     """
-    list_books = []
-    quantity_books = 0
-    for category in categories:
-        url = f"{Config.URL_BASE}{category['href']}"
-        response = get_with_retry(url)
+
+    def __init__(self, pages=None, rows=None):
+        self.pages = pages or {}
+        self.by_category = {}
+        for row in rows or []:
+            book = {k: v for k, v in row.items() if k != "id"}
+            self.by_category.setdefault(book["category"], []).append(book)
+
+    @classmethod
+    def load(cls, csv_path):
+        try:
+            with open(manifest_path(csv_path), encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("source") != source_stamp(csv_path):
+                return cls()
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f, delimiter=";"))
+        except (OSError, ValueError):
+            return cls()
+        return cls(data.get("pages"), rows)
+
+    @staticmethod
+    def save(csv_path, pages):
+        """Grava as entradas `pages` (url -> entrada), amarradas ao CSV atual."""
+        path = manifest_path(csv_path)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": source_stamp(csv_path), "pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def reusable(self, url, category_name):
+        """Linhas atuais da página `url`, se o manifesto tiver uma entrada coerente para ela."""
+        entry = self.pages.get(url)
+        if entry is None:
+            return None
+        rows = self.by_category.get(category_name, [])
+        start, count = entry["offset"], entry["count"]
+        if start + count > len(rows):
+            return None
+        return rows[start:start + count]
+
+
+def _conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+# ================= Pipeline: fetch -> parse -> normalize -> write =================
+#
+# Cada página é um dict que atravessa os estágios:
+#   url, category, category_index, next, entry (manifesto), outcome,
+#   html (até o parse), rows (livros sem id), books (com id, após normalize)
+# Entre os estágios há filas limitadas (`staged`), então só uma janela de
+# páginas fica em memória, independente do tamanho do catálogo.
+
+QUEUE_SIZE = int(os.getenv("SCRAPING_QUEUE_SIZE", "32"))
+# Processos de parse; com um único núcleo o parse roda na própria thread do estágio
+PARSE_WORKERS = int(os.getenv("SCRAPING_PARSE_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+
+
+def staged(source, maxsize=QUEUE_SIZE):
+    """
+    Roda o gerador `source` numa thread própria e repassa seus itens por uma
+    fila limitada: quem produz bloqueia quando o estágio seguinte está
+    atrasado. Exceções do produtor são relançadas no consumidor.
+    """
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in source:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+
+    threading.Thread(target=run, name="scraping-stage", daemon=True).start()
+    try:
+        while True:
+            kind, item = q.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def find_next_url(html, base_url):
+    """URL da próxima página (link "next" do paginador), ou None."""
+    # o paginador fica no fim da página: basta parsear a partir dele
+    start = html.rfind('class="pager"')
+    if start >= 0:
+        html = html[html.rfind("<", 0, start):]
+    pager = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("li", class_="next"))
+    next_page = pager.find("li", class_="next")
+    return urljoin(base_url, next_page.find("a").get("href")) if next_page else None
+
+
+def fetch_category(category, manifest, base_url=None, start_url=None):
+    """
+    Baixa as páginas de uma categoria, em ordem, seguindo o link "next"
+    (a partir de `start_url`, ao retomar uma coleta).
+
+    Páginas já vistas no manifesto são pedidas de forma condicional: um 304,
+    ou um corpo com o mesmo hash, reaproveita as linhas atuais do CSV e a
+    página não passa pelo parse.
+    """
+    name = category["name"].strip()
+    category_url = urljoin(base_url or Config.URL_BASE, category["href"])
+    category_base_url = get_parent_url(category_url)
+    pages = []
+    url = start_url or category_url
+    while url:
+        entry = manifest.pages.get(url)
+        previous_rows = manifest.reusable(url, name)
+        headers = _conditional_headers(entry) if previous_rows is not None else None
+        response = get_with_retry(url, headers=headers)
+        # uma página faltando deixaria o CSV sem parte do catálogo: a coleta toda falha
         if response is None:
-            continue
-        soup = BeautifulSoup(response.text, "html.parser")
-        soup_books = soup.find_all("article", class_="product_pod")
-        for book in soup_books:
-            quantity_books += 1
-            list_books.append(
-                {
-                    "id": quantity_books,
-                    "title": book.find("h3").find("a").get("title").strip(),
-                    "price": book.find("p", class_="price_color").text.strip(),
-                    "rating": book.find("p", class_="star-rating")
-                    .get("class")[1]
-                    .strip(),
-                    "availability": book.find(
-                        "p", class_="instock availability"
-                    ).text.strip(),
-                    "category": category["name"].strip(),
-                    "image": book.find("img").get("src").strip(),
-                }
-            )
-        next_page = soup.find("li", class_="next")
-        if next_page:
-            url_next_page = get_parent_url(
-                f"{Config.URL_BASE}{category['href']}"
+            raise ScrapeFailed(f"Falha ao baixar {url}")
+        if response.status_code not in (200, 304) or (response.status_code == 304 and previous_rows is None):
+            raise ScrapeFailed(f"Resposta inesperada para {url}: HTTP {response.status_code}")
+        digest = hashlib.sha256(response.content).hexdigest() if response.status_code == 200 else entry["sha256"]
+        page = {"url": url, "category": name, "html": None, "rows": None}
+        if previous_rows is not None and digest == entry["sha256"]:
+            page["rows"] = previous_rows
+            page["next"] = entry["next"]
+            page["outcome"] = "not_modified" if response.status_code == 304 else "same_hash"
+        else:
+            page["html"] = response.text
+            page["next"] = find_next_url(response.text, category_base_url)
+            page["outcome"] = "parsed"
+        page["entry"] = {
+            "etag": response.headers.get("ETag") or (entry or {}).get("etag"),
+            "last_modified": response.headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+            "sha256": digest,
+            "next": page["next"],
+        }
+        pages.append(page)
+        url = page["next"]
+    return pages
+
+
+def fetch_pages(categories, manifest, base_url=None, max_workers=MAX_WORKERS, start=(0, None)):
+    """
+    Estágio fetch: baixa as categorias em paralelo e produz as páginas na
+    ordem das categorias. No máximo 2 * `max_workers` categorias ficam em voo
+    (ou prontas esperando a vez), o que limita a memória.
+    `start` = (índice da categoria, URL da página) de onde retomar.
+    """
+    first, start_url = start
+    todo = iter(range(first, len(categories)))
+    window = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def submit(i):
+            url = start_url if i == first else None
+            window.append((i, pool.submit(fetch_category, categories[i], manifest, base_url, url)))
+
+        # janela de 2x os workers: uma categoria longa na frente não deixa workers ociosos
+        for i in islice(todo, 2 * max_workers):
+            submit(i)
+        while window:
+            i, future = window.popleft()
+            pages = future.result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                submit(nxt)
+            for page in pages:
+                page["category_index"] = i
+                yield page
+
+
+def parse_pages(pages, backend=None, workers=0):
+    """
+    Estágio parse: HTML -> livros (páginas reaproveitadas passam direto).
+
+    Com `workers`, o parse roda num pool de processos -- fora do GIL e em
+    paralelo com os downloads -- com no máximo QUEUE_SIZE páginas pendentes,
+    entregues na ordem original.
+    """
+    if not workers:
+        for page in pages:
+            if page["rows"] is None:
+                page["rows"] = parse_listing(page.pop("html"), page["category"], backend)
+            yield page
+        return
+
+    def resolve(page, future):
+        if future is not None:
+            page["rows"] = future.result()
+        return page
+
+    window = deque()
+    context = multiprocessing.get_context("spawn")  # fork com threads vivas não é seguro
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for page in pages:
+            future = None
+            if page["rows"] is None:
+                future = pool.submit(parse_listing, page.pop("html"), page["category"], backend)
+            window.append((page, future))
+            if len(window) >= QUEUE_SIZE:
+                yield resolve(*window.popleft())
+        while window:
+            yield resolve(*window.popleft())
+
+
+def number_books(pages, first_id=1):
+    """Estágio normalize: ids sequenciais na ordem das categorias e páginas."""
+    next_id = first_id
+    for page in pages:
+        page["books"] = [{"id": next_id + k, **book} for k, book in enumerate(page["rows"])]
+        next_id += len(page["books"])
+        yield page
+
+
+def get_books(categories, base_url=None, max_workers=MAX_WORKERS, manifest=None):
+    """
+    Coleta os livros de todas as categorias passadas como parâmetro, em memória.
+
+    As categorias são baixadas em paralelo; os ids seguem a ordem das
+    categorias e das páginas, então o resultado é o mesmo de uma coleta
+    sequencial. Para o catálogo inteiro, prefira `scrape`, que grava em fluxo.
+    """
+    pages = fetch_pages(categories, manifest or Manifest(), base_url, max_workers)
+    return [book for page in number_books(parse_pages(pages)) for book in page["books"]]
+
+
+FIELDNAMES = ["id", "title", "price", "rating", "availability", "category", "image"]
+
+
+class Checkpoint:
+    """
+    Estágio write + progresso de uma coleta, para retomá-la após uma falha.
+
+    Ao lado do CSV ficam, durante a coleta:
+      books_data.csv.tmp          linhas já gravadas (vira o CSV no final)
+      books_data.pages.tmp        entradas do manifesto, uma por página
+      books_data.checkpoint.json  última página concluída e o tamanho válido
+                                  dos dois arquivos acima
+    Ao retomar, os arquivos são truncados para o último checkpoint e a coleta
+    continua da página seguinte, com os ids a partir de onde parou.
+    """
+
+    def __init__(self, csv_path, categories):
+        self.csv_path = Path(csv_path)
+        self.tmp_file = Path(f"{self.csv_path}.tmp")
+        self.pages_file = self.csv_path.with_suffix(".pages.tmp")
+        self.path = self.csv_path.with_suffix(".checkpoint.json")
+        self.categories = [c["href"] for c in categories]
+        self.state = {
+            "categories": self.categories,
+            "category": 0,
+            "next": None,
+            "rows": 0,
+            "category_rows": 0,
+            "csv_bytes": 0,
+            "pages_bytes": 0,
+            "stats": {},
+        }
+        self.resumed = False
+
+    def resume(self):
+        """Carrega o checkpoint, se houver um compatível com esta coleta."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+            valid = (
+                state["categories"] == self.categories
+                and os.path.getsize(self.tmp_file) >= state["csv_bytes"]
+                and os.path.getsize(self.pages_file) >= state["pages_bytes"]
             )
-            url_next_page = url_next_page + next_page.find("a").get("href")
-            response_next_page = get_with_retry(url_next_page)
-            if response_next_page is None:
-                continue
-            while response_next_page.status_code == 200:
-                soup_next_page = BeautifulSoup(response_next_page.text, "html.parser")
-                soup_books_next_page = soup_next_page.find_all(
-                    "article", class_="product_pod"
-                )
-                for book in soup_books_next_page:
-                    quantity_books += 1
-                    list_books.append(
-                        {
-                            "id": quantity_books,
-                            "title": book.find("h3").find("a").get("title").strip(),
-                            "price": book.find("p", class_="price_color").text.strip(),
-                            "rating": book.find("p", class_="star-rating")
-                            .get("class")[1]
-                            .strip(),
-                            "availability": book.find(
-                                "p", class_="instock availability"
-                            ).text.strip(),
-                            "category": category["name"].strip(),
-                            "image": book.find("img").get("src").strip(),
-                        }
-                    )
-                next_page = soup_next_page.find("li", class_="next")
-                if next_page:
-                    category_base_url = get_parent_url(
-                        f"{Config.URL_BASE}{category['href']}"
-                    )
-                    url_next_page = urljoin(
-                        category_base_url, next_page.find("a").get("href")
-                    )
-                    response_next_page = get_with_retry(url_next_page)
-                    if response_next_page is None:
-                        break
-                else:
-                    break
-    return list_books
+        except (OSError, ValueError, KeyError):
+            return False
+        if valid:
+            self.state = state
+            self.resumed = True
+        return self.resumed
+
+    @property
+    def start(self):
+        """(categoria, URL) da primeira página ainda não gravada."""
+        if self.state["next"] is None:
+            return self.state["category"] + (1 if self.resumed else 0), None
+        return self.state["category"], self.state["next"]
+
+    @property
+    def stats(self):
+        return self.state["stats"]
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def write(self, pages, progress=None):
+        """
+        Consome as páginas numeradas, gravando e fazendo checkpoint a cada uma.
+        `progress(evento)` é chamado após cada página.
+        """
+        state = self.state
+        if self.resumed:
+            os.truncate(self.tmp_file, state["csv_bytes"])
+            os.truncate(self.pages_file, state["pages_bytes"])
+        mode = "a" if self.resumed else "w"
+        with open(self.tmp_file, mode, newline="", encoding="utf-8") as csvfile, \
+                open(self.pages_file, mode, encoding="utf-8") as journal:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, delimiter=";")
+            if not self.resumed:
+                writer.writeheader()
+            for page in pages:
+                if page["category_index"] != state["category"]:
+                    state["category"] = page["category_index"]
+                    state["category_rows"] = 0
+                writer.writerows(page["books"])
+                entry = {**page["entry"], "offset": state["category_rows"], "count": len(page["books"])}
+                journal.write(json.dumps([page["url"], entry], ensure_ascii=False) + "\n")
+                csvfile.flush()
+                journal.flush()
+                state["next"] = page["next"]
+                state["rows"] += len(page["books"])
+                state["category_rows"] += len(page["books"])
+                state["csv_bytes"] = os.fstat(csvfile.fileno()).st_size
+                state["pages_bytes"] = os.fstat(journal.fileno()).st_size
+                state["stats"][page["outcome"]] = state["stats"].get(page["outcome"], 0) + 1
+                self._save()
+                if progress is not None:
+                    done = page["category_index"] + (1 if page["next"] is None else 0)
+                    progress(self.progress(categories_done=done))
+
+    def progress(self, **extra):
+        return {"pages": sum(self.stats.values()), "books": self.state["rows"], **extra}
+
+    def manifest_pages(self):
+        with open(self.pages_file, encoding="utf-8") as f:
+            return dict(json.loads(line) for line in f)
+
+    def clear(self):
+        for path in (self.path, self.pages_file, self.tmp_file):
+            path.unlink(missing_ok=True)
+
+
+def publish_csv(tmp_file, path_file):
+    """
+    Gera o snapshot binário a partir do CSV temporário e troca o CSV de uma
+    vez: a API nunca lê um CSV pela metade.
+    """
+    # o snapshot registra tamanho/mtime do CSV (preservados pelo rename)
+    columns = records_to_columns(load_books(Path(tmp_file)))
+    write_snapshot(snapshot_path(path_file), columns, source=tmp_file)
+    os.replace(tmp_file, path_file)
 
 
 def save_to_csv(books, filename=Config.CSV_FILE):
     """
-    Salva os dados dos livros em um arquivo CSV
+    Salva os dados dos livros em um arquivo CSV e, ao lado dele, o snapshot
+    binário já parseado que a API carrega na inicialização
     """
     path_file = os.path.join(Config.DATA_DIR, filename)
-    fieldnames = ["id", "title", "price", "rating", "availability", "category", "image"]
 
-    with open(path_file, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=";")
+    tmp_file = f"{path_file}.tmp"
+    with open(tmp_file, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, delimiter=";")
 
         writer.writeheader()
 
         writer.writerows(books)
+    publish_csv(tmp_file, path_file)
+
+
+class ScrapeInProgress(RuntimeError):
+    """Outra coleta já está gravando este CSV."""
+
+
+# Códigos de saída do script: outra coleta já está rodando / coleta incompleta
+EXIT_BUSY = 3
+EXIT_FAILED = 4
+
+
+@contextmanager
+def exclusive_run(csv_path):
+    """
+    Lock de arquivo (flock) ao lado do CSV: uma coleta por vez, mesmo entre
+    processos diferentes (vários workers da API, execução manual...).
+    """
+    with open(Path(csv_path).with_suffix(".lock"), "a+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ScrapeInProgress(f"Já existe uma coleta em andamento para {csv_path}") from None
+        yield
+
+
+def scrape(csv_path=Config.CSV_FILE, full=False, resume=True, progress=None):
+    """
+    Coleta completa ou incremental (padrão), gravada em fluxo no CSV.
+
+    Se uma coleta anterior foi interrompida, continua do último checkpoint
+    (a menos que `resume` seja False). Se nada mudou no site, o CSV atual é
+    mantido e a API não recarrega. Se a lista de categorias ou alguma página
+    não puder ser baixada, levanta ScrapeFailed sem publicar nada (o
+    checkpoint fica para a próxima coleta retomar). `progress(evento)`
+    recebe o total de categorias no início e as contagens (páginas, livros)
+    a cada página.
+    Retorna as contagens de páginas por resultado (parsed, not_modified, ...)
+    e se o CSV mudou.
+    """
+    csv_path = Path(csv_path)
+    with exclusive_run(csv_path):
+        manifest = Manifest() if full else Manifest.load(csv_path)
+        categories = get_categories(Config.URL_BASE)
+        if not categories:
+            raise ScrapeFailed(f"Nenhuma categoria encontrada em {Config.URL_BASE}")
+        checkpoint = Checkpoint(csv_path, categories)
+        if resume and checkpoint.resume():
+            print(f"Retomando a coleta: {checkpoint.state['rows']} livros já gravados")
+        if progress is not None:
+            progress(checkpoint.progress(
+                categories=len(categories),
+                categories_done=checkpoint.start[0],
+                expected_pages=len(manifest.pages) or None,
+            ))
+
+        pages = staged(fetch_pages(categories, manifest, start=checkpoint.start))
+        pages = staged(parse_pages(pages, workers=PARSE_WORKERS))
+        checkpoint.write(number_books(pages, first_id=checkpoint.state["rows"] + 1), progress)
+
+        stats = dict(checkpoint.stats)
+        stats["changed"] = not (csv_path.exists() and filecmp.cmp(checkpoint.tmp_file, csv_path, shallow=False))
+        if stats["changed"]:
+            publish_csv(checkpoint.tmp_file, csv_path)
+        Manifest.save(csv_path, checkpoint.manifest_pages())
+        checkpoint.clear()
+    return stats
 
 
 if __name__ == "__main__":
-    print("Iniciando a coleta de dados...")
-    categories = get_categories(Config.URL_BASE)
-    books = get_books(categories)
-    save_to_csv(books)
-    print("Coleta de dados concluída com sucesso!")
+    parser = argparse.ArgumentParser(description="Coleta os livros de books.toscrape.com")
+    parser.add_argument("--full", action="store_true", help="ignora o manifesto e baixa/parseia tudo")
+    parser.add_argument("--restart", action="store_true", help="descarta o checkpoint de uma coleta interrompida")
+    parser.add_argument("--progress", action="store_true", help="emite o progresso como JSON, uma linha por evento")
+    parser.add_argument("--csv", type=Path, default=Config.CSV_FILE, help="CSV de destino")
+    args = parser.parse_args()
+
+    def emit(event):
+        print(json.dumps(event), flush=True)
+
+    if not args.progress:
+        print("Iniciando a coleta de dados...")
+    try:
+        stats = scrape(args.csv, full=args.full, resume=not args.restart, progress=emit if args.progress else None)
+    except ScrapeInProgress as e:
+        print(e, file=sys.stderr)
+        sys.exit(EXIT_BUSY)
+    except ScrapeFailed as e:
+        if args.progress:
+            emit({"error": str(e)})
+        print(f"Coleta abortada, nada foi publicado: {e}", file=sys.stderr)
+        sys.exit(EXIT_FAILED)
+    if args.progress:
+        emit({"result": stats})
+    else:
+        print(f"Coleta de dados concluída com sucesso! {stats}")